@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+#
+#  Decode micro-benchmark
+#
+#  Times the JSON decode of recorded weather and forecast responses with
+#  each available backend (stdlib json, ujson, orjson) and the streaming
+#  forecast decoder, and shows the bytes on the wire with and without
+#  gzip.
+#
+#  usage: python3 bench/bench_decode.py [iterations]
+
+import os
+import sys
+import gzip
+import json
+import timeit
+import importlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from nodes import jsoncodec
+from nodes import jsonstream
+
+FIXTURES = ('weather', 'forecast')
+CHUNK_SIZE = 8192
+
+
+def load_fixture(name):
+    with open(os.path.join(BENCH_DIR, 'fixtures', name + '.json'), 'rb') as f:
+        return f.read()
+
+
+# The backends that are installed, name -> loads function
+def backends():
+    found = {'json': json.loads}
+    for name in ('ujson', 'orjson'):
+        try:
+            found[name] = importlib.import_module(name).loads
+        except ImportError:
+            pass
+    return found
+
+
+def stream_decode(raw):
+    chunks = [raw[i:i + CHUNK_SIZE] for i in range(0, len(raw), CHUNK_SIZE)]
+    stream = jsonstream.ArrayStream(chunks, 'list')
+    for entry in stream:
+        pass
+    return stream.header
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    decoders = backends()
+
+    print('default backend: ' + jsoncodec.BACKEND)
+    print('%-10s %10s %10s %6s' % ('endpoint', 'bytes', 'gzip', 'ratio'))
+    for name in FIXTURES:
+        raw = load_fixture(name)
+        packed = gzip.compress(raw)
+        print('%-10s %10d %10d %5.1f%%' % (name, len(raw), len(packed), 100.0 * len(packed) / len(raw)))
+
+    print('')
+    print('%-10s %-10s %12s' % ('endpoint', 'decoder', 'us/decode'))
+    for name in FIXTURES:
+        raw = load_fixture(name)
+        tests = list(decoders.items())
+        tests.append(('gzip+' + jsoncodec.BACKEND, lambda r, p=gzip.compress(raw): jsoncodec.loads(gzip.decompress(p))))
+        if name == 'forecast':
+            tests.append(('stream', stream_decode))
+
+        for (decoder, func) in tests:
+            seconds = min(timeit.repeat(lambda: func(raw), number=iterations, repeat=3))
+            print('%-10s %-10s %12.1f' % (name, decoder, seconds * 1e6 / iterations))
+
+
+if __name__ == '__main__':
+    main()
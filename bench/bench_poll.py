@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+#
+#  Offline benchmark of the poll path
+#
+#  Runs the controller against a stand-in polyinterface (bench/stubs) and
+#  recorded API responses (bench/fixtures) so nothing needs Polyglot or an
+#  API key. Times the conditions and forecast queries, the forecast node
+#  update, the ET0 calculation and parameter lookups and writes the results
+#  as JSON so runs from different versions can be compared.
+#
+#  usage: python3 bench/bench_poll.py [-n iterations] [-o results.json] [--text]
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [os.path.join(BENCH_DIR, 'stubs'), REPO_DIR]
+
+import polyinterface
+from nodes import owm
+from nodes import et3
+from nodes import aggregate
+from nodes import jsoncodec
+from nodes import http_client
+
+# endpoint -> fixture file
+FIXTURES = {
+        'weather': 'weather',
+        'uvi': 'uvi',
+        'forecast': 'forecast',
+        'uvi/forecast': 'uvi_forecast',
+        }
+
+PARAMS = {
+        'APIkey': 'bench',
+        'Location': '95112,US',
+        'Units': 'imperial',
+        'Forecast Days': '5',
+        'Elevation': '30',
+        'Plant Type': '0.23',
+        # no quota limits while benchmarking
+        'Calls Per Minute': '1000000000',
+        'Calls Per Day': '1000000000',
+        }
+
+CHUNK_SIZE = 8192
+
+
+def load_fixtures():
+    raw = {}
+    for (endpoint, name) in FIXTURES.items():
+        with open(os.path.join(BENCH_DIR, 'fixtures', name + '.json'), 'rb') as f:
+            raw[endpoint] = f.read()
+    return raw
+
+
+# HTTP client that answers from the fixtures. The bodies still go
+# through the JSON decoders so decoding is part of the timings.
+class FixtureHttp(http_client.HttpClient):
+    def __init__(self, raw):
+        super(FixtureHttp, self).__init__()
+        self.raw = raw
+        self.requests = 0
+
+    def body(self, url):
+        self.requests += 1
+        endpoint = url.split('/data/2.5/')[1].split('?')[0]
+        if endpoint == 'group':
+            weather = jsoncodec.loads(self.raw['weather'])
+            return jsoncodec.dumps({'cnt': 1, 'list': [weather]}).encode('utf-8')
+        return self.raw[endpoint]
+
+    def get_json(self, url):
+        return jsoncodec.loads(self.body(url))
+
+    def get_stream(self, url, handler):
+        body = self.body(url)
+        return handler(body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+
+
+def make_controller(raw):
+    poly = polyinterface.Interface()
+    poly.polyConfig['customParams'] = dict(PARAMS)
+    controller = owm.Controller(poly)
+    # polyinterface adds the controller node when the config arrives
+    controller.addNode(controller)
+    controller.http = FixtureHttp(raw)
+    controller.check_params()
+    controller.discover()
+    controller.query_conditions()
+    return controller
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# Call func iterations times and return the timing summary in
+# microseconds. setup is called before each call and isn't timed.
+def measure(func, iterations, setup=None):
+    samples = []
+    for i in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return {
+            'iterations': iterations,
+            'mean_us': sum(samples) / len(samples),
+            'min_us': min(samples),
+            'p50_us': percentile(samples, 0.50),
+            'p99_us': percentile(samples, 0.99),
+            }
+
+
+def run(iterations):
+    raw = load_fixtures()
+    controller = make_controller(raw)
+    site = controller.sites[0]
+    forecast_nodes = [controller.nodes[site.forecast_address(d)] for d in range(int(PARAMS['Forecast Days']))]
+    fcast = controller.build_forecast(jsoncodec.loads(raw['forecast']),
+                                      jsoncodec.loads(raw['uvi/forecast']),
+                                      controller.site_timezone(site))
+    day = [f for f in fcast if f.count == 8][0]
+    node = forecast_nodes[0]
+
+    def uncached():
+        controller.cache.invalidate()
+
+    def uncached_cold():
+        controller.cache.invalidate()
+        for n in forecast_nodes:
+            n.fingerprint = None
+            n.clear_published()
+
+    def cold_node():
+        node.clear_published()
+        et3.evapotranspiration_cached.cache_clear()
+
+    results = {}
+    results['query_conditions'] = measure(lambda: controller.query_conditions(force=True), iterations, uncached)
+    results['query_forecast'] = measure(controller.query_forecast, iterations, uncached)
+    results['query_forecast_cold'] = measure(controller.query_forecast, iterations, uncached_cold)
+    results['daily_update_forecast'] = measure(
+            lambda: node.update_forecast(day, site.record.latitude, 30, 0.23, 'imperial', force=True),
+            iterations, cold_node)
+    results['et3_evapotranspriation'] = measure(
+            lambda: et3.evapotranspriation(27.3, 10.7, None, 1.3, 401.33, 91, 36, 36.82, 0.23, 289),
+            iterations * 10)
+    results['params_get'] = measure(lambda: controller.params.get('Units'), iterations * 10)
+
+    return {
+            'benchmark': 'poll',
+            'timestamp': int(time.time()),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'numpy': aggregate.numpy is not None,
+            'json_backend': jsoncodec.BACKEND,
+            'requests': controller.http.requests,
+            'messages': controller.poly.sent,
+            'results': results,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the node server poll path offline')
+    parser.add_argument('-n', '--iterations', type=int, default=200)
+    parser.add_argument('-o', '--output', help='write the JSON results to this file')
+    parser.add_argument('--text', action='store_true', help='also print a table')
+    args = parser.parse_args()
+
+    report = run(args.iterations)
+
+    if args.text:
+        print('%-26s %10s %10s %10s %10s' % ('benchmark', 'mean us', 'min us', 'p50 us', 'p99 us'), file=sys.stderr)
+        for (name, r) in report['results'].items():
+            print('%-26s %10.1f %10.1f %10.1f %10.1f' % (name, r['mean_us'], r['min_us'], r['p50_us'], r['p99_us']), file=sys.stderr)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+#
+#  Local stand-in for the OpenWeatherMap 2.5 API
+#
+#  Serves the recorded responses in bench/fixtures for the weather, group,
+#  uvi, forecast, uvi/forecast and onecall endpoints. Latency, server
+#  errors, rate limiting (429) and truncated bodies can be injected to see
+#  how the node server copes with a slow or flaky service.
+#
+#  Point the node server at it with the OWM_BASE_URL and OWM_ONECALL_URL
+#  environment variables:
+#
+#    python3 bench/fake_owm.py --port 8081 --latency lognormal:80,0.5 --errors 0.05
+#    OWM_BASE_URL=http://127.0.0.1:8081/data/2.5/ OWM_ONECALL_URL=http://127.0.0.1:8081/data/3.0/ python3 owm.py
+#
+#  Latency distributions (milliseconds):
+#    fixed:MS  uniform:MIN,MAX  exponential:MEAN  lognormal:MEDIAN,SIGMA
+
+import os
+import sys
+import gzip
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PREFIX = '/data/2.5/'
+ONECALL_PREFIX = '/data/3.0/'
+
+# endpoint -> fixture file
+FIXTURES = {
+        'weather': 'weather',
+        'uvi': 'uvi',
+        'forecast': 'forecast',
+        'uvi/forecast': 'uvi_forecast',
+        'onecall': 'onecall',
+        }
+
+
+def load_fixtures():
+    data = {}
+    for (endpoint, name) in FIXTURES.items():
+        with open(os.path.join(BENCH_DIR, 'fixtures', name + '.json'), 'rb') as f:
+            data[endpoint] = f.read()
+    return data
+
+
+def encode(data):
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+# Parse a latency specification into a function returning seconds
+def latency_function(spec, rng):
+    if spec is None or spec == '':
+        return lambda: 0.0
+    (kind, sep, args) = spec.partition(':')
+    values = [float(v) for v in args.split(',')] if args else []
+    if kind == 'fixed':
+        return lambda: values[0] / 1000.0
+    if kind == 'uniform':
+        return lambda: rng.uniform(values[0], values[1]) / 1000.0
+    if kind == 'exponential':
+        return lambda: rng.expovariate(1.0 / values[0]) / 1000.0
+    if kind == 'lognormal':
+        # median in ms and the sigma of the underlying normal distribution
+        mu = math.log(values[0])
+        return lambda: rng.lognormvariate(mu, values[1]) / 1000.0
+    raise ValueError('Unknown latency distribution ' + spec)
+
+
+class Faults:
+    def __init__(self, latency=None, errors=0.0, rate_limited=0.0, truncated=0.0, seed=None):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.latency = latency_function(latency, self.rng)
+        self.errors = errors
+        self.rate_limited = rate_limited
+        self.truncated = truncated
+
+    # Pick what happens to a request: (delay, outcome)
+    def draw(self):
+        with self.lock:
+            delay = self.latency()
+            r = self.rng.random()
+        if r < self.errors:
+            return (delay, 'error')
+        r -= self.errors
+        if r < self.rate_limited:
+            return (delay, 'rate_limited')
+        r -= self.rate_limited
+        if r < self.truncated:
+            return (delay, 'truncated')
+        return (delay, 'ok')
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == ONECALL_PREFIX + 'onecall':
+            endpoint = 'onecall'
+        elif url.path.startswith(PREFIX) and url.path != PREFIX + 'onecall':
+            endpoint = url.path[len(PREFIX):]
+        else:
+            return self.reply(404, {'cod': '404', 'message': 'Internal error'})
+        query = parse_qs(url.query)
+
+        if 'appid' not in query:
+            return self.reply(401, {'cod': 401, 'message': 'Invalid API key.'})
+
+        if endpoint == 'group':
+            weather = json.loads(self.server.fixtures['weather'])
+            ids = query.get('id', [''])[0].split(',')
+            records = []
+            for city_id in ids:
+                record = dict(weather)
+                record['id'] = int(city_id) if city_id.isdigit() else weather['id']
+                records.append(record)
+            body = encode({'cnt': len(records), 'list': records})
+        elif endpoint in self.server.fixtures:
+            body = self.server.fixtures[endpoint]
+        else:
+            return self.reply(404, {'cod': '404', 'message': 'Internal error'})
+
+        (delay, outcome) = self.server.faults.draw()
+        self.server.stats.count(outcome)
+        if delay > 0:
+            time.sleep(delay)
+
+        if outcome == 'error':
+            return self.reply(502, {'cod': 502, 'message': 'Bad gateway'})
+        if outcome == 'rate_limited':
+            return self.reply(429, {'cod': 429, 'message': 'Your account is temporary blocked due to exceeding of requests limitation of your subscription type.'})
+        self.reply(200, body, truncate=(outcome == 'truncated'))
+
+    # Send a JSON reply. A truncated reply promises the full length but
+    # closes the connection half way through the body.
+    def reply(self, status, data, truncate=False):
+        payload = data if isinstance(data, bytes) else encode(data)
+        compress = 'gzip' in self.headers.get('Accept-Encoding', '')
+        if compress:
+            payload = gzip.compress(payload)
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(payload)))
+        if truncate:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+
+        if truncate:
+            self.wfile.write(payload[:len(payload) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+        else:
+            self.wfile.write(payload)
+
+
+class FakeOwmServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, faults=None, verbose=False):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.fixtures = load_fixtures()
+        self.faults = faults if faults is not None else Faults()
+        self.stats = Stats()
+        self.verbose = verbose
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:%d%s' % (self.server_address[1], PREFIX)
+
+    @property
+    def onecall_url(self):
+        return 'http://127.0.0.1:%d%s' % (self.server_address[1], ONECALL_PREFIX)
+
+    # Serve from a background thread
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='fake_owm', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def fault_arguments(parser):
+    parser.add_argument('--latency', default='', help='latency distribution, e.g. lognormal:80,0.5')
+    parser.add_argument('--errors', type=float, default=0.0, help='fraction of requests answered with a 502')
+    parser.add_argument('--rate-limited', type=float, default=0.0, help='fraction of requests answered with a 429')
+    parser.add_argument('--truncated', type=float, default=0.0, help='fraction of responses cut off half way')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def faults_from_arguments(args):
+    return Faults(args.latency, args.errors, args.rate_limited, args.truncated, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the OpenWeatherMap API')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('-v', '--verbose', action='store_true')
+    fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeOwmServer(args.port, faults_from_arguments(args), args.verbose)
+    print('Serving on ' + server.base_url + ' and ' + server.onecall_url, file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(server.stats.snapshot()), file=sys.stderr)
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+#
+#  Load test against the local OpenWeatherMap stand-in
+#
+#  Starts bench/fake_owm.py in process (or uses --url) and drives a number
+#  of controller instances, each with its own HTTP client, through poll
+#  cycles at the same time. A cycle is a current conditions query followed
+#  by a forecast query with the response cache cleared so every cycle
+#  goes to the server. Reports the cycle latency percentiles, the errors
+#  logged by the node server and what the server injected, as JSON.
+#
+#  python3 bench/load_test.py -c 20 -n 10 --latency lognormal:80,0.6 --errors 0.05 --rate-limited 0.02 --truncated 0.02
+
+import sys
+import json
+import time
+import logging
+import argparse
+import concurrent.futures
+
+import bench_poll
+import fake_owm
+import polyinterface
+from nodes import owm
+from nodes import http_client
+
+
+# Counts the errors the node server logs
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, logging.ERROR)
+        self.errors = 0
+
+    def emit(self, record):
+        self.errors += 1
+
+
+def make_controller(base_url, onecall_url, index):
+    poly = polyinterface.Interface()
+    params = dict(bench_poll.PARAMS)
+    params['Location'] = '%05d,US' % (10000 + index)
+    poly.polyConfig['customParams'] = params
+    controller = owm.Controller(poly)
+    # polyinterface adds the controller node when the config arrives
+    controller.addNode(controller)
+    controller.http = http_client.HttpClient()
+    controller.concurrent_fetch = True
+    controller.urls.set_base_url(base_url, onecall_url)
+    controller.check_params()
+    controller.discover()
+    return controller
+
+
+def cycle(controller):
+    start = time.perf_counter()
+    controller.cache.invalidate()
+    controller.query_conditions(refresh=True)
+    controller.query_forecast()
+    return time.perf_counter() - start
+
+
+def summary(samples):
+    ms = [s * 1000.0 for s in samples]
+    return {
+            'count': len(ms),
+            'mean_ms': sum(ms) / len(ms),
+            'p50_ms': bench_poll.percentile(ms, 0.50),
+            'p90_ms': bench_poll.percentile(ms, 0.90),
+            'p99_ms': bench_poll.percentile(ms, 0.99),
+            'max_ms': max(ms),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the node server against a local API stand-in')
+    parser.add_argument('-c', '--controllers', type=int, default=10, help='number of controller instances')
+    parser.add_argument('-n', '--cycles', type=int, default=10, help='poll cycles per controller')
+    parser.add_argument('--url', help='use an already running server instead of starting one')
+    parser.add_argument('--onecall-url', help='One Call base URL of the running server')
+    parser.add_argument('-o', '--output', help='write the JSON results to this file')
+    fake_owm.fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    onecall_url = args.onecall_url
+    if base_url is None:
+        server = fake_owm.FakeOwmServer(0, fake_owm.faults_from_arguments(args)).start()
+        base_url = server.base_url
+        onecall_url = server.onecall_url
+
+    counter = ErrorCounter()
+    polyinterface.LOGGER.addHandler(counter)
+
+    controllers = [make_controller(base_url, onecall_url, i) for i in range(args.controllers)]
+    setup_errors = counter.errors
+
+    samples = []
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.controllers) as pool:
+        for n in range(args.cycles):
+            samples.extend(pool.map(cycle, controllers))
+    elapsed = time.perf_counter() - started
+
+    for controller in controllers:
+        controller.http.close()
+
+    report = {
+            'benchmark': 'load',
+            'timestamp': int(time.time()),
+            'controllers': args.controllers,
+            'cycles': args.cycles,
+            'elapsed_s': elapsed,
+            'cycle_latency': summary(samples),
+            'logged_errors': counter.errors - setup_errors,
+            'faults': {
+                'latency': args.latency,
+                'errors': args.errors,
+                'rate_limited': args.rate_limited,
+                'truncated': args.truncated,
+                },
+            }
+    if server is not None:
+        report['server'] = server.stats.snapshot()
+        server.stop()
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
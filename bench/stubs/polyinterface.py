@@ -0,0 +1,96 @@
+#
+#  Stand-in for polyinterface used by the benchmarks
+#
+#  Only what the node server uses is implemented. Messages that would go
+#  to Polyglot are counted instead of sent.
+
+import logging
+
+LOGGER = logging.getLogger('owm-bench')
+LOGGER.addHandler(logging.NullHandler())
+LOGGER.setLevel(logging.WARNING)
+
+
+class Interface:
+    def __init__(self):
+        self.sent = 0
+        self.polyConfig = {'customParams': {}, 'customData': {}, 'shortPoll': 300,
+                           'longPoll': 600, 'logFile': 'logs/debug.log'}
+
+    def send(self, message):
+        self.sent += 1
+
+    def onConfig(self, callback):
+        pass
+
+    def saveCustomData(self, data):
+        self.polyConfig['customData'] = dict(data)
+
+    def addCustomParam(self, params):
+        pass
+
+    def addNotice(self, *args):
+        pass
+
+    def removeNotice(self, *args):
+        pass
+
+    def removeNoticesAll(self):
+        pass
+
+
+class Node:
+    def __init__(self, controller, primary, address, name):
+        self.controller = controller
+        self.parent = controller
+        self.primary = primary
+        self.address = address
+        self.name = name
+        if not hasattr(self, 'drivers'):
+            self.drivers = []
+
+    def setDriver(self, driver, value, report=True, force=False, uom=None):
+        for d in self.drivers:
+            if d['driver'] == driver:
+                d['value'] = value
+                if uom is not None:
+                    d['uom'] = uom
+        if report:
+            self.controller.poly.send({'status': {'address': self.address, 'driver': driver, 'value': value}})
+
+    def reportDrivers(self):
+        for d in self.drivers:
+            self.controller.poly.send({'status': {'address': self.address, 'driver': d['driver'], 'value': d['value']}})
+
+    def start(self):
+        pass
+
+
+class Controller(Node):
+    def __init__(self, poly):
+        self.poly = poly
+        self.polyConfig = poly.polyConfig
+        self.nodes = {}
+        super(Controller, self).__init__(self, 'controller', 'controller', 'controller')
+
+    def addNode(self, node):
+        self.nodes[node.address] = node
+        return node
+
+    def delNode(self, address):
+        self.nodes.pop(address, None)
+
+    def addCustomParam(self, params):
+        self.poly.addCustomParam(params)
+
+    def saveCustomData(self, data):
+        self.poly.saveCustomData(data)
+
+    def addNotice(self, *args):
+        self.poly.addNotice(*args)
+
+    def removeNotice(self, *args):
+        self.poly.removeNotice(*args)
+
+    def removeNoticesAll(self):
+        self.poly.removeNoticesAll()
@@ -26,15 +26,70 @@ def add_functions_as_methods(functions):
     return decorator
 
 
+# Minimum change in a driver value before it's sent again. Drivers that
+# aren't listed are sent whenever the value changes. A node can use its
+# own table by setting a 'deadband' attribute.
+DEADBAND = {
+        'CLITEMP': 0.1,   # temperature
+        'GV0': 0.1,       # max temp
+        'GV1': 0.1,       # min temp
+        'CLIHUM': 1,      # humidity
+        'BARPRES': 0.5,   # pressure
+        'WINDDIR': 1,     # direction
+        'GV4': 0.1,       # wind speed
+        'GV5': 0.1,       # gust speed
+        'GV14': 1,        # cloud conditions
+        'DISTANC': 0.1,   # visibility
+        'UV': 0.1,        # UV index
+        }
+
 # Wrap all the setDriver calls so that we can check that the 
 # value exist first.
+#
+# Values that haven't changed since they were last sent (by more than the
+# driver's deadband) are not sent again unless force is set.
 def update_driver(self, driver, value, force=False, prec=3):
     try:
-        self.setDriver(driver, round(float(value), prec), True, force, self.uom[driver])
-        LOGGER.debug('setDriver (%s, %f)' %(driver, float(value)))
+        value = round(float(value), prec)
+        uom = self.uom[driver]
+    except:
+        LOGGER.warning('Missing data for driver ' + driver)
+        return
+
+    if not force and not self.driver_changed(driver, value, uom):
+        return
+
+    try:
+        self.setDriver(driver, value, True, force, uom)
+        self.published_drivers()[driver] = (value, uom)
+        LOGGER.debug('setDriver (%s, %f)', driver, value)
     except:
         LOGGER.warning('Missing data for driver ' + driver)
 
+# The last value and uom sent for each driver of this node
+def published_drivers(self):
+    if not hasattr(self, 'published'):
+        self.published = {}
+    return self.published
+
+def driver_changed(self, driver, value, uom):
+    published = self.published_drivers()
+    if driver not in published:
+        return True
+
+    (last_value, last_uom) = published[driver]
+    if last_uom != uom:
+        return True
+
+    deadband = getattr(self, 'deadband', DEADBAND).get(driver, 0)
+    if deadband == 0:
+        return value != last_value
+    return abs(value - last_value) >= deadband
+
+# Forget what was sent so the next update sends every driver
+def clear_published(self):
+    self.published = {}
+
 def get_saved_log_level(self):
     if 'customData' in self.polyConfig:
         if 'level' in self.polyConfig['customData']:
@@ -46,7 +101,19 @@ def save_log_level(self, level):
     level_data = {
             'level': level,
             }
-    self.poly.saveCustomData(level_data)
+    self.save_custom_data(level_data)
+
+# saveCustomData replaces everything that is stored so merge the new
+# values with what's already there.
+def save_custom_data(self, data):
+    if 'customData' in self.polyConfig and self.polyConfig['customData'] is not None:
+        custom_data = dict(self.polyConfig['customData'])
+    else:
+        custom_data = {}
+
+    custom_data.update(data)
+    self.polyConfig['customData'] = custom_data
+    self.poly.saveCustomData(custom_data)
 
 def set_logging_level(self, level=None):
     if level is None:
@@ -66,7 +133,7 @@ def set_logging_level(self, level=None):
     LOGGER.info('set_logging_level: Setting log level to %d' % level)
     LOGGER.setLevel(level)
 
-functions = (update_driver, get_saved_log_level, save_log_level, set_logging_level)
+functions = (update_driver, published_drivers, driver_changed, clear_published, get_saved_log_level, save_log_level, save_custom_data, set_logging_level)
 
 """
     Functions to handle custom parameters.
@@ -90,53 +157,75 @@ functions = (update_driver, get_saved_log_level, save_log_level, set_logging_lev
        self.params.get('param1')
        if self.params.isSet('param1'):
 
+    Each parameter has a version that goes up every time its value
+    changes and the store has a generation that goes up when any value
+    changes. Anything derived from the configuration can be cached and
+    rebuilt when the generation no longer matches.
+
 """
 
+class Parameter:
+    __slots__ = ('name', 'value', 'default', 'isSet', 'isRequired',
+                 'notice_msg', 'isChanged', 'version')
+
+    def __init__(self, name, default, isRequired, notice_msg):
+        self.name = name
+        self.value = ''
+        self.default = default
+        self.isSet = False
+        self.isRequired = isRequired
+        self.notice_msg = notice_msg
+        self.isChanged = False
+        self.version = 0
+
 class NSParameters:
     def __init__(self, parameters):
-        self.internal = []
+        self.internal = []    # in the order they were given
+        self.index = {}       # by name
+        self.generation = 0
 
         for p in parameters:
-            self.internal.append({
-                'name': p['name'],
-                'value': '', 
-                'default': p['default'],
-                'isSet': False,
-                'isRequired': p['isRequired'],
-                'notice_msg': p['notice'],
-                'isChanged': False,
-                })
+            param = Parameter(p['name'], p['default'], p['isRequired'], p['notice'])
+            self.internal.append(param)
+            self.index[param.name] = param
+
+    # Store a new value, counting it if it's different
+    def _store(self, p, value):
+        if p.value != value:
+            p.version += 1
+            self.generation += 1
+        p.value = value
 
     def set(self, name, value):
-        for p in self.internal:
-            if p['name'] == name:
-                if p['value'] != value:
-                    p['isChanged'] = True
-                else:
-                    p['isChanged'] = False
-                p['value'] = value
-                p['isSet'] = True
-                return
+        p = self.index.get(name)
+        if p is None:
+            return
+        p.isChanged = (p.value != value)
+        self._store(p, value)
+        p.isSet = True
 
     def get(self, name):
-        for p in self.internal:
-            if p['name'] == name:
-                if p['isSet']:
-                    return p['value']
-                else:
-                    return p['default']
+        p = self.index.get(name)
+        if p is None:
+            return None
+        if p.isSet:
+            return p.value
+        return p.default
 
     def isSet(self, name):
-        for p in self.internal:
-            if p['name'] == name:
-                return p['isSet']
-        return False
+        p = self.index.get(name)
+        return p is not None and p.isSet
 
     def isChanged(self, name):
-        for p in self.internal:
-            if p['name'] == name:
-                return p['isChanged']
-        return False
+        p = self.index.get(name)
+        return p is not None and p.isChanged
+
+    # Number of times the parameter's value has changed
+    def version(self, name):
+        p = self.index.get(name)
+        if p is None:
+            return 0
+        return p.version
 
     """
         Send notices for unconfigured parameters that are are marked
@@ -144,12 +233,12 @@ class NSParameters:
     """
     def send_notices(self, poly):
         for p in self.internal:
-            if not p['isSet'] and p['isRequired']:
-                if p['notice_msg'] is not None:
+            if not p.isSet and p.isRequired:
+                if p.notice_msg is not None:
                     try:
-                        poly.addNotice(p['notice_msg'], p['name'])
+                        poly.addNotice(p.notice_msg, p.name)
                     except:
-                        poly.addNotice({p['name']: p['notice_msg']})
+                        poly.addNotice({p.name: p.notice_msg})
 
     """
         Read paramenters from Polyglot and update values appropriately.
@@ -162,31 +251,27 @@ class NSParameters:
         params = {}
 
         for p in self.internal:
-            LOGGER.debug('checking for ' + p['name'] + ' in customParams')
-            if p['name'] in customParams:
-                LOGGER.debug('found ' + p['name'] + ' in customParams')
-                val = customParams[p['name']]
-
-                if val != p['value']:
-                    p['isChanged'] = True
-                else:
-                    p['isChanged'] = False
+            LOGGER.debug('checking for ' + p.name + ' in customParams')
+            if p.name in customParams:
+                LOGGER.debug('found ' + p.name + ' in customParams')
+                val = customParams[p.name]
 
-                p['value'] = val
+                p.isChanged = (val != p.value)
+                self._store(p, val)
 
-                if p['value'] != p['default']:
-                    LOGGER.debug(p['name'] + ' is now set')
-                    p['isSet'] = True
+                if p.value != p.default:
+                    LOGGER.debug(p.name + ' is now set')
+                    p.isSet = True
             
-            if p['isSet']:
-                params[p['name']] = p['value']
+            if p.isSet:
+                params[p.name] = p.value
             else:
-                params[p['name']] = p['default']
+                params[p.name] = p.default
 
         poly.addCustomParam(params)            
 
         for p in self.internal:
-            if not p['isSet'] and p['isRequired']:
+            if not p.isSet and p.isRequired:
                 return False
         return True
 
@@ -201,24 +286,25 @@ class NSParameters:
         valid = True
 
         if 'customParams' in config:
+            custom = config['customParams']
             for p in self.internal:
-                if p['name'] in config['customParams']:
-                    poly_param = config['customParams'][p['name']]
+                if p.name in custom:
+                    poly_param = custom[p.name]
 
                     # did it change?
-                    if poly_param != p['default'] and poly_param != p['value']:
+                    if poly_param != p.default and poly_param != p.value:
                         changed = True
-                        p['isChanged'] = True
+                        p.isChanged = True
                     else:
-                        p['isChanged'] = False
+                        p.isChanged = False
 
                     # is it different from the default?
-                    if poly_param != p['default']:
-                        p['value'] = poly_param
-                        p['isSet'] = True
+                    if poly_param != p.default:
+                        self._store(p, poly_param)
+                        p.isSet = True
 
         for p in self.internal:
-            if not p['isSet'] and p['isRequired']:
+            if not p.isSet and p.isRequired:
                 valid = False
 
         return (valid, changed)
@@ -0,0 +1,280 @@
+#
+#  Forecast aggregation
+#
+#  The free forecast is a list of 3 hour entries (and the hourly data is
+#  a list of 1 hour entries). To show a daily forecast the entries are
+#  grouped by day and reduced to min/max/mean/sum values per day.
+#
+#  The entries are read once into typed columns and the per day values
+#  are computed over the columns. NumPy is used when it's available,
+#  otherwise the same reductions are done over array.array columns.
+#
+#  Day breaks use the location's offset from UTC (the 'timezone' value
+#  the API returns), not the host's timezone. A day id is the number of
+#  days since the epoch in the location's local time and is computed
+#  with integer arithmetic, as are the day of week and day of year.
+
+import time
+from array import array
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SECONDS_PER_DAY = 86400
+
+# One day of forecast. Produced by daily_forecast() and
+# onecall.daily_forecast(), used by the forecast nodes.
+class ForecastDay:
+    __slots__ = ('dt', 'temp_max', 'temp_min', 'Hmax', 'Hmin', 'pressure',
+                 'weather', 'speed', 'winddir', 'clouds', 'rain', 'snow',
+                 'count', 'uv', 'dow', 'yday')
+
+    def __init__(self, dt, temp_max, temp_min, Hmax, Hmin, pressure, weather,
+                 speed, winddir, clouds, rain, snow, count, uv=0.0, dow=None, yday=None):
+        self.dt = dt                # time of the last entry of the day
+        self.temp_max = temp_max
+        self.temp_min = temp_min
+        self.Hmax = Hmax            # humidity
+        self.Hmin = Hmin
+        self.pressure = pressure
+        self.weather = weather      # condition code
+        self.speed = speed          # wind
+        self.winddir = winddir
+        self.clouds = clouds
+        self.rain = rain            # totals for the day
+        self.snow = snow
+        self.count = count          # number of 3 hour entries, 8 for a full day
+        self.uv = uv
+        self.dow = dow              # 0 = Sunday
+        self.yday = yday            # day of the year, 1 - 366
+
+    def values(self):
+        return tuple([getattr(self, name) for name in self.__slots__])
+
+    def __eq__(self, other):
+        return isinstance(other, ForecastDay) and self.values() == other.values()
+
+    def __hash__(self):
+        return hash(self.values())
+
+    def __repr__(self):
+        return 'ForecastDay(' + ', '.join(['%s=%s' % (name, getattr(self, name)) for name in self.__slots__]) + ')'
+
+
+# Columns pulled from each forecast entry
+FLOAT_COLUMNS = ('temp', 'humidity', 'pressure', 'weather', 'speed',
+                 'winddir', 'clouds', 'rain', 'snow')
+
+
+# Precipitation is optional and can be a total for 3h or 1h
+def _precipitation(entry, tag):
+    if tag not in entry:
+        return 0.0
+    value = entry[tag]
+    if isinstance(value, dict):
+        if '3h' in value:
+            return float(value['3h'])
+        if '1h' in value:
+            return float(value['1h'])
+        return 0.0
+    return float(value)
+
+
+# Read the list of entries into columns. Handles both the forecast
+# format (values under 'main', 'wind') and the flat One Call hourly
+# format.
+def read_columns(entries):
+    dt = array('q')
+    cols = {}
+    for name in FLOAT_COLUMNS:
+        cols[name] = array('d')
+
+    temp = cols['temp'].append
+    humidity = cols['humidity'].append
+    pressure = cols['pressure'].append
+    weather = cols['weather'].append
+    speed = cols['speed'].append
+    winddir = cols['winddir'].append
+    clouds = cols['clouds'].append
+    rain = cols['rain'].append
+    snow = cols['snow'].append
+
+    for entry in entries:
+        dt.append(int(entry['dt']))
+        if 'main' in entry:
+            main = entry['main']
+            temp(main['temp'])
+            humidity(main['humidity'])
+            pressure(main['pressure'])
+            wind = entry.get('wind', {})
+            speed(wind.get('speed', 0.0))
+            winddir(wind.get('deg', 0.0))
+            c = entry.get('clouds', 0.0)
+            clouds(c['all'] if isinstance(c, dict) else c)
+        else:
+            temp(entry['temp'])
+            humidity(entry['humidity'])
+            pressure(entry['pressure'])
+            speed(entry.get('wind_speed', 0.0))
+            winddir(entry.get('wind_deg', 0.0))
+            clouds(entry.get('clouds', 0.0))
+        weather(entry['weather'][0]['id'] if 'weather' in entry else 0.0)
+        rain(_precipitation(entry, 'rain'))
+        snow(_precipitation(entry, 'snow'))
+
+    return (dt, cols)
+
+
+# The columns as a plain dictionary of lists, for caching, and back.
+def columns_to_dict(dt, cols):
+    data = {'dt': dt.tolist()}
+    for name in FLOAT_COLUMNS:
+        data[name] = cols[name].tolist()
+    return data
+
+def columns_from_dict(data):
+    dt = array('q', data['dt'])
+    cols = {}
+    for name in FLOAT_COLUMNS:
+        cols[name] = array('d', data[name])
+    return (dt, cols)
+
+
+# Offset from UTC of the host's local time, used for the day breaks when
+# the location's offset isn't known.
+def local_offset(dt):
+    return time.localtime(dt).tm_gmtoff
+
+
+# Local day id of a timestamp
+def day_id(dt, tz_offset):
+    return (int(dt) + tz_offset) // SECONDS_PER_DAY
+
+# 0 = Sunday, the epoch was a Thursday
+def day_of_week(day):
+    return (day + 4) % 7
+
+# Day of the year (1 - 366) from a day id, using the days from civil
+# algorithm (http://howardhinnant.github.io/date_algorithms.html)
+def day_of_year(day):
+    z = day + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)   # March 1st based
+    mp = (5 * doy + 2) // 153
+    month = mp + 3 if mp < 10 else mp - 9
+    year = yoe + era * 400 + (1 if month <= 2 else 0)
+    leap = 1 if (year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)) else 0
+    if month <= 2:
+        # Jan/Feb are at the end of a March based year
+        return doy - 306 + 1
+    return doy + 59 + leap + 1
+
+
+# Index of the first entry of each day. dt must be sorted.
+def day_starts(dt, tz_offset):
+    if numpy is not None and not isinstance(dt, array):
+        keys = (dt + tz_offset) // SECONDS_PER_DAY
+        return numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(keys)) + 1))
+
+    starts = [0]
+    prev = (dt[0] + tz_offset) // SECONDS_PER_DAY
+    for i in range(1, len(dt)):
+        key = (dt[i] + tz_offset) // SECONDS_PER_DAY
+        if key != prev:
+            starts.append(i)
+            prev = key
+    return starts
+
+
+# Group the entries by day and reduce them. Returns a list of ForecastDay
+# records in the order of the days.
+#
+# uv_values is a list of UV index values, one per day.
+# precipitation_factor converts the rain/snow totals from mm.
+# tz_offset is the location's offset from UTC in seconds.
+def daily_forecast(entries, uv_values=None, precipitation_factor=1.0, tz_offset=None):
+    (dt, cols) = read_columns(entries)
+    return reduce_columns(dt, cols, uv_values, precipitation_factor, tz_offset)
+
+
+# Same as daily_forecast for entries that were already read into columns
+def reduce_columns(dt, cols, uv_values=None, precipitation_factor=1.0, tz_offset=None):
+    if len(dt) == 0:
+        return []
+
+    if tz_offset is None:
+        tz_offset = local_offset(dt[0])
+
+    if numpy is not None:
+        days = _reduce_numpy(dt, cols, tz_offset)
+    else:
+        days = _reduce_python(dt, cols, tz_offset)
+
+    for (day, d) in enumerate(days):
+        if uv_values is not None and day < len(uv_values):
+            d.uv = float(uv_values[day])
+        d.rain *= precipitation_factor
+        d.snow *= precipitation_factor
+        local_day = day_id(d.dt, tz_offset)
+        d.dow = day_of_week(local_day)
+        d.yday = day_of_year(local_day)
+
+    return days
+
+
+def _reduce_numpy(dt, cols, tz_offset):
+    dt = numpy.frombuffer(dt, dtype=numpy.int64)
+    c = {name: numpy.frombuffer(cols[name], dtype=numpy.float64) for name in FLOAT_COLUMNS}
+
+    starts = day_starts(dt, tz_offset)
+    ends = numpy.concatenate((starts[1:], [len(dt)]))
+    counts = ends - starts
+
+    temp_max = numpy.maximum.reduceat(c['temp'], starts)
+    temp_min = numpy.minimum.reduceat(c['temp'], starts)
+    h_max = numpy.maximum.reduceat(c['humidity'], starts)
+    h_min = numpy.minimum.reduceat(c['humidity'], starts)
+    pressure = numpy.add.reduceat(c['pressure'], starts) / counts
+    speed = numpy.add.reduceat(c['speed'], starts) / counts
+    winddir = numpy.add.reduceat(c['winddir'], starts) / counts
+    clouds = numpy.add.reduceat(c['clouds'], starts) / counts
+    rain = numpy.add.reduceat(c['rain'], starts)
+    snow = numpy.add.reduceat(c['snow'], starts)
+    last = ends - 1
+
+    weather = c['weather'][last].tolist()
+    dt = dt[last].tolist()
+    return [ForecastDay(*values) for values in zip(
+        dt, temp_max.tolist(), temp_min.tolist(), h_max.tolist(),
+        h_min.tolist(), pressure.tolist(), weather, speed.tolist(),
+        winddir.tolist(), clouds.tolist(), rain.tolist(), snow.tolist(),
+        counts.tolist())]
+
+
+def _reduce_python(dt, cols, tz_offset):
+    starts = day_starts(dt, tz_offset)
+    ends = starts[1:] + [len(dt)]
+
+    days = []
+    for (s, e) in zip(starts, ends):
+        count = e - s
+        temp = cols['temp'][s:e]
+        humidity = cols['humidity'][s:e]
+        days.append(ForecastDay(
+            dt[e - 1],
+            max(temp),
+            min(temp),
+            max(humidity),
+            min(humidity),
+            sum(cols['pressure'][s:e]) / count,
+            cols['weather'][e - 1],
+            sum(cols['speed'][s:e]) / count,
+            sum(cols['winddir'][s:e]) / count,
+            sum(cols['clouds'][s:e]) / count,
+            sum(cols['rain'][s:e]),
+            sum(cols['snow'][s:e]),
+            count))
+    return days
@@ -0,0 +1,208 @@
+#
+#  Response cache for the OpenWeatherMap queries
+#
+#  OpenWeatherMap only updates its data every so often (about every 10
+#  minutes for the current conditions and less often for forecasts) so
+#  there is no point in asking again before that. Responses are cached
+#  per endpoint and location with a time to live for each endpoint.
+#
+#  Once an entry expires it is still served for a while (the stale
+#  window) while a background thread fetches a fresh copy. If a refresh
+#  fails, the last good response is returned instead. Requests for an
+#  entry that's already being fetched wait for that fetch instead of
+#  making their own.
+#
+#  The cache can optionally be backed by a directory on disk so that a
+#  restart doesn't need to query everything again.
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import os
+import re
+from nodes import jsoncodec
+import time
+import threading
+
+LOGGER = polyinterface.LOGGER
+
+# Time to live, in seconds, for each endpoint
+TTL = {
+        'weather': 600,
+        'uvi': 1800,
+        'forecast': 1800,
+        'uvi/forecast': 3600,
+        'onecall': 600,
+        }
+DEFAULT_TTL = 600
+
+# Directory used for the disk backed cache, relative to the node server
+CACHE_DIR = 'cache'
+
+
+class CacheEntry:
+    __slots__ = ('data', 'fetched')
+
+    def __init__(self, data, fetched):
+        self.data = data
+        self.fetched = fetched
+
+
+class PendingFetch:
+    __slots__ = ('done', 'data')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.data = None
+
+
+class ResponseCache:
+    def __init__(self, ttl=TTL, stale_factor=1.0, directory=None):
+        self.ttl = dict(ttl)
+        self.stale_factor = stale_factor
+        self.directory = None
+        self.entries = {}
+        self.refreshing = set()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.set_directory(directory)
+
+    # Enable (or with None, disable) the disk backed store
+    def set_directory(self, directory):
+        if directory is not None and not os.path.exists(directory):
+            try:
+                os.makedirs(directory)
+            except Exception as e:
+                LOGGER.error('Unable to create cache directory: ' + str(e))
+                directory = None
+        self.directory = directory
+
+    def get_ttl(self, endpoint):
+        return self.ttl.get(endpoint, DEFAULT_TTL)
+
+    # Return the data for endpoint/key. fetch is called with no arguments
+    # to get fresh data and should return None on failure.
+    #
+    # max_age overrides the endpoint's TTL, used when we know newer data
+    # should be available.
+    def get(self, endpoint, key, fetch, max_age=None):
+        cache_key = endpoint + '|' + key
+        now = time.time()
+        ttl = self.get_ttl(endpoint)
+        if max_age is not None:
+            ttl = min(ttl, max_age)
+
+        entry = self._lookup(cache_key)
+        if entry is not None:
+            age = now - entry.fetched
+            if age < ttl:
+                LOGGER.debug('Cache hit for %s (age %ds)', endpoint, age)
+                return entry.data
+            if max_age is None and age < ttl * (1 + self.stale_factor):
+                LOGGER.debug('Serving stale %s (age %ds) while refreshing', endpoint, age)
+                self._refresh_background(cache_key, fetch)
+                return entry.data
+
+        data = self._refresh(cache_key, fetch)
+        if data is None and entry is not None:
+            LOGGER.warning('Refresh of ' + endpoint + ' failed, using data from %d seconds ago' % (now - entry.fetched))
+            return entry.data
+        return data
+
+    # Add data that was fetched outside of get()
+    def put(self, endpoint, key, data):
+        cache_key = endpoint + '|' + key
+        entry = CacheEntry(data, time.time())
+        with self.lock:
+            self.entries[cache_key] = entry
+        self._save(cache_key, entry)
+
+    def invalidate(self, endpoint=None):
+        with self.lock:
+            if endpoint is None:
+                self.entries = {}
+            else:
+                for k in [k for k in self.entries if k.startswith(endpoint + '|')]:
+                    del self.entries[k]
+
+    def _lookup(self, cache_key):
+        with self.lock:
+            entry = self.entries.get(cache_key)
+        if entry is None:
+            entry = self._load(cache_key)
+            if entry is not None:
+                with self.lock:
+                    self.entries.setdefault(cache_key, entry)
+        return entry
+
+    # Only one fetch per key at a time, the others get its result
+    def _refresh(self, cache_key, fetch):
+        with self.lock:
+            pending = self.pending.get(cache_key)
+            waiting = pending is not None
+            if not waiting:
+                pending = PendingFetch()
+                self.pending[cache_key] = pending
+        if waiting:
+            pending.done.wait()
+            return pending.data
+
+        try:
+            data = fetch()
+            if data is not None:
+                entry = CacheEntry(data, time.time())
+                with self.lock:
+                    self.entries[cache_key] = entry
+                self._save(cache_key, entry)
+            pending.data = data
+        finally:
+            with self.lock:
+                del self.pending[cache_key]
+            pending.done.set()
+        return data
+
+    def _refresh_background(self, cache_key, fetch):
+        with self.lock:
+            if cache_key in self.refreshing:
+                return
+            self.refreshing.add(cache_key)
+
+        def worker():
+            try:
+                self._refresh(cache_key, fetch)
+            except Exception as e:
+                LOGGER.error('Background refresh failed: ' + str(e))
+            finally:
+                with self.lock:
+                    self.refreshing.discard(cache_key)
+
+        threading.Thread(target=worker, name='owm_refresh', daemon=True).start()
+
+    def _path(self, cache_key):
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9_.-]', '_', cache_key) + '.json')
+
+    def _load(self, cache_key):
+        if self.directory is None:
+            return None
+        path = self._path(cache_key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                saved = jsoncodec.loads(f.read())
+            return CacheEntry(saved['data'], float(saved['fetched']))
+        except Exception as e:
+            LOGGER.warning('Ignoring unreadable cache file ' + path + ': ' + str(e))
+            return None
+
+    def _save(self, cache_key, entry):
+        if self.directory is None:
+            return
+        path = self._path(cache_key)
+        try:
+            with open(path + '.tmp', 'w') as f:
+                f.write(jsoncodec.dumps({'fetched': entry.fetched, 'data': entry.data}))
+            os.replace(path + '.tmp', path)
+        except Exception as e:
+            LOGGER.warning('Failed to write cache file ' + path + ': ' + str(e))
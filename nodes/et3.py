@@ -5,6 +5,11 @@
 # http://edis.ifas.ufl.edu/pdffiles/ae/ae45900.pdf
 
 import math
+import functools
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # Formulas and constants
 vaporRate = 237.3
@@ -84,8 +89,9 @@ def long_wave_radiation(min_t, max_t, vp, sr, clear_sky):
     rel4 = 1.35 * sr / clear_sky - 0.35;
     return rel1 * rel2 * rel3 * rel4;
 
-# calculate the approx. solar radiation  in mega-joules/m2
-def calc_solar_radiation(t_min, t_max, lat, declination, julian_day):
+# calculate the approx. extraterrestrial radiation used to estimate the
+# solar radiation
+def estimated_extraterrestrial_radiation(lat, declination, julian_day):
 
     Dr = 1.0 + 0.033 * math.cos(2 * math.pi / 365 * julian_day)
 
@@ -97,12 +103,79 @@ def calc_solar_radiation(t_min, t_max, lat, declination, julian_day):
 
     omega = math.acos(omega_pre)
 
-    Ra = 24.0 / math.pi * 4.92 * Dr * (omega * math.sin(lat) * math.sin(declination) + math.cos(lat) * math.cos(declination) * math.sin(omega))
+    return 24.0 / math.pi * 4.92 * Dr * (omega * math.sin(lat) * math.sin(declination) + math.cos(lat) * math.cos(declination) * math.sin(omega))
+
+# calculate the approx. solar radiation  in mega-joules/m2
+def calc_solar_radiation(t_min, t_max, lat, declination, julian_day):
+
+    Ra = estimated_extraterrestrial_radiation(lat, declination, julian_day)
 
     Rs = 0.17 * math.sqrt(t_max - t_min) * Ra
 
     return Rs
-    
+
+
+# Solar geometry
+#
+# The earth-sun distance, declination and radiation values only depend
+# on the latitude and the day of the year so they're calculated once, the
+# first time a day is used for a latitude, and looked up after that. The
+# tables are kept per latitude, normally one for each
+# configured location.
+DAYS_IN_TABLE = 367     # indexed by julian day, 0 - 366
+MAX_TABLES = 32
+
+class SolarTable:
+    __slots__ = ('latitude', 'latitude_r', 'Ra_est', 'Ra', 'arrays')
+
+    def __init__(self, latitude):
+        self.latitude = latitude
+        self.latitude_r = deg2rad(latitude)
+        self.Ra_est = [None] * DAYS_IN_TABLE   # radiation used by calc_solar_radiation()
+        self.Ra = [None] * DAYS_IN_TABLE       # extraterrestrial radiation, nan if the sun doesn't set/rise
+        self.arrays = None
+
+    # Fill in the values for a day, days are only calculated when they're
+    # first used.
+    def fill(self, julian_day):
+        dist = relative_earth_sun_distance(julian_day)
+        declination = solar_declination(julian_day)
+        self.Ra_est[julian_day] = estimated_extraterrestrial_radiation(self.latitude_r, declination, julian_day)
+        try:
+            angle = sunset_hour_angle(self.latitude_r, declination)
+            self.Ra[julian_day] = extraterrestrial_radiation(dist, angle, self.latitude_r, declination)
+        except ValueError:
+            self.Ra[julian_day] = float('nan')
+
+    # (Ra_est, Ra) for a day
+    def lookup(self, julian_day):
+        if self.Ra[julian_day] is None:
+            self.fill(julian_day)
+        return (self.Ra_est[julian_day], self.Ra[julian_day])
+
+    # Ra_est and Ra for the whole year as NumPy arrays
+    def as_arrays(self):
+        if self.arrays is None:
+            for julian_day in range(DAYS_IN_TABLE):
+                if self.Ra[julian_day] is None:
+                    self.fill(julian_day)
+            self.arrays = (numpy.array(self.Ra_est), numpy.array(self.Ra))
+        return self.arrays
+
+_solar_tables = {}
+
+def solar_table(latitude):
+    table = _solar_tables.get(latitude)
+    if table is None:
+        if len(_solar_tables) >= MAX_TABLES:
+            _solar_tables.clear()
+        table = SolarTable(latitude)
+        _solar_tables[latitude] = table
+    return table
+
+def _in_table(julian_day):
+    return julian_day == int(julian_day) and 0 <= julian_day < DAYS_IN_TABLE
+
 
 # temperature in C
 # elevation in meters
@@ -146,26 +219,36 @@ def evapotranspriation(max_t, min_t, solar_radiation, avg_ws, elevation, max_h,
     # step 11.1, vapor pressure deficit
     vp_deficit = vp_curve - vp_actual
 
-    # step 12.1, relative sun earth distance
-    dist = relative_earth_sun_distance(julian_day)
+    if _in_table(julian_day):
+        # steps 12 - 15 from the solar geometry table
+        (Ra_est, Ra) = solar_table(latitude).lookup(int(julian_day))
+        if Ra != Ra:
+            raise ValueError('math domain error')
+        if solar_radiation is None:
+            Rs = 0.17 * math.sqrt(max_t - min_t) * Ra_est
+        else:
+            Rs = w2mj(solar_radiation)
+    else:
+        # step 12.1, relative sun earth distance
+        dist = relative_earth_sun_distance(julian_day)
 
-    # step 12.2, solar declination
-    declination = solar_declination(julian_day)
+        # step 12.2, solar declination
+        declination = solar_declination(julian_day)
 
-    # step 13, latitude in radians
-    latitude_r = deg2rad(latitude)
+        # step 13, latitude in radians
+        latitude_r = deg2rad(latitude)
 
-    ## Testing solar radiation calculation
-    if solar_radiation is None:
-        Rs = calc_solar_radiation(min_t, max_t, latitude_r, declination, julian_day)
-    else:
-        Rs = w2mj(solar_radiation)
+        ## Testing solar radiation calculation
+        if solar_radiation is None:
+            Rs = calc_solar_radiation(min_t, max_t, latitude_r, declination, julian_day)
+        else:
+            Rs = w2mj(solar_radiation)
 
-    # step 14, sunset hour angle
-    angle = sunset_hour_angle(latitude_r, declination)
+        # step 14, sunset hour angle
+        angle = sunset_hour_angle(latitude_r, declination)
 
-    # step 15, extraerrestrial radiation
-    Ra = extraterrestrial_radiation(dist, angle, latitude_r, declination)
+        # step 15, extraerrestrial radiation
+        Ra = extraterrestrial_radiation(dist, angle, latitude_r, declination)
 
     # step 16, clear sky solar radiation
     Rso = clear_sky_solar_radiation(elevation, Ra)
@@ -193,6 +276,126 @@ def evapotranspriation(max_t, min_t, solar_radiation, avg_ws, elevation, max_h,
     return radiation_term + wind_term
 
 
+# evapotranspriation() memoized on its arguments. The forecast for a day
+# often doesn't change between polls so the same ET0 is asked for again.
+@functools.lru_cache(maxsize=128)
+def evapotranspiration_cached(max_t, min_t, solar_radiation, avg_ws, elevation, max_h, min_h, latitude, canopy_coefficient, day):
+    return evapotranspriation(max_t, min_t, solar_radiation, avg_ws, elevation, max_h, min_h, latitude, canopy_coefficient, day)
+
+
+# Batch version of evapotranspriation, with the same arguments in the
+# same order. The arguments can be lists (or arrays) with one value per
+# day or single values that apply to every day. Returns a list with the
+# ET0 for each day.
+#
+# NumPy is used when it's available, otherwise each day is calculated
+# with evapotranspriation(). Both give the same values (the NumPy math
+# functions can differ in the last bit, far below the precision the
+# drivers are rounded to). A day whose values are out of range (the
+# sun doesn't set or rise at the latitude or max_t < min_t) gives nan.
+def evapotranspiration_batch(max_t, min_t, solar_radiation, avg_ws, elevation, max_h, min_h, latitude, canopy_coefficient, day):
+    args = [max_t, min_t, avg_ws, elevation, max_h, min_h, latitude, canopy_coefficient, day]
+    count = max([len(a) if _is_sequence(a) else 1 for a in args])
+
+    if numpy is not None and solar_radiation is None:
+        return _et0_numpy(count, *args).tolist()
+
+    columns = [a if _is_sequence(a) else [a] * count for a in args]
+    if solar_radiation is None or not _is_sequence(solar_radiation):
+        columns.append([solar_radiation] * count)
+    else:
+        columns.append(solar_radiation)
+
+    et0 = []
+    for (Tmax, Tmin, Ws, elev, Hmax, Hmin, lat, cc, J, sr) in zip(*columns):
+        try:
+            et0.append(evapotranspriation(Tmax, Tmin, sr, Ws, elev, Hmax, Hmin, lat, cc, J))
+        except (ValueError, ZeroDivisionError):
+            et0.append(float('nan'))
+    return et0
+
+def _is_sequence(value):
+    return hasattr(value, '__len__')
+
+# The same steps as evapotranspriation() using NumPy ufuncs
+def _et0_numpy(count, max_t, min_t, avg_ws, elevation, max_h, min_h, latitude, canopy_coefficient, day):
+    def column(value):
+        return numpy.broadcast_to(numpy.asarray(value, dtype=numpy.float64), (count,))
+
+    max_t = column(max_t)
+    min_t = column(min_t)
+    avg_ws = column(avg_ws)
+    elevation = column(elevation)
+    max_h = column(max_h)
+    min_h = column(min_h)
+    latitude = column(latitude)
+    canopy_coefficient = column(canopy_coefficient)
+    julian_day = column(day)
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        def sat_vapor(t):
+            return 0.6108 * numpy.exp((enthalpy * t) / (t + vaporRate))
+
+        mean_daily_temp = (max_t + min_t) / 2.0
+        vp_slope = 4098 * sat_vapor(mean_daily_temp) / numpy.power(mean_daily_temp + vaporRate, 2)
+        pressure = 101.3 * numpy.power((293 - 0.0065 * elevation) / 293, 5.26)
+        psychrometric = 0.000665 * pressure
+        bottom = vp_slope + psychrometric * (1 + 0.34 * avg_ws)
+        delta = vp_slope / bottom
+        psi = psychrometric / bottom
+        t_term = (900) / (mean_daily_temp + kelvin) * avg_ws
+
+        vp_curve = (sat_vapor(max_t) + sat_vapor(min_t)) / 2
+        vp_actual = (sat_vapor(min_t) * (max_h/100) + sat_vapor(max_t) * (min_h/100)) / 2
+
+        geometry = _solar_numpy_table(latitude, julian_day)
+        if geometry is not None:
+            (Ra_est, Ra) = geometry
+        else:
+            dist = 1 + 0.033 * numpy.cos(((2 * math.pi) / 365) * julian_day)
+            declination = 0.409 * numpy.sin(((2 * math.pi) / 365) * julian_day - 1.39)
+            latitude_r = math.pi / 180 * latitude
+
+            # calc_solar_radiation
+            omega = numpy.arccos(numpy.clip(-numpy.tan(latitude_r) * numpy.tan(declination), -1.0, 1.0))
+            Ra_est = 24.0 / math.pi * 4.92 * dist * (omega * numpy.sin(latitude_r) * numpy.sin(declination) + numpy.cos(latitude_r) * numpy.cos(declination) * numpy.sin(omega))
+
+            angle = numpy.arccos(-1 * numpy.tan(latitude_r) * numpy.tan(declination))
+            Ra = 24*60 / math.pi * (solarConstant * dist) * ((angle * numpy.sin(latitude_r) * numpy.sin(declination)) + (numpy.cos(latitude_r) * numpy.cos(declination) * numpy.sin(angle)))
+
+        Rs = 0.17 * numpy.sqrt(max_t - min_t) * Ra_est
+        Rso = (0.75 + (2 * math.pow(10, -5)) * elevation) * Ra
+
+        Rns = (1 - canopy_coefficient) * Rs
+        Rnl = 4.903 * math.pow(10, -9) * ((numpy.power(max_t + kelvin, 4) + numpy.power(min_t + kelvin, 4)) / 2) * (0.34 - 0.14 * numpy.sqrt(vp_actual)) * (1.35 * Rs / Rso - 0.35)
+        Rng = (Rns - Rnl) * 0.408
+
+        return delta * Rng + psi * t_term * (vp_curve - vp_actual)
+
+# Look up Ra_est and Ra for each day in the solar tables. Returns None if
+# the days aren't all whole days of the year or there are too many
+# latitudes to keep tables for.
+def _solar_numpy_table(latitude, julian_day):
+    days = julian_day.astype(numpy.int64)
+    if not numpy.array_equal(days, julian_day) or days.min() < 0 or days.max() >= DAYS_IN_TABLE:
+        return None
+
+    latitudes = numpy.unique(latitude)
+    if len(latitudes) > MAX_TABLES:
+        return None
+
+    if len(latitudes) == 1:
+        (Ra_est, Ra) = solar_table(float(latitudes[0])).as_arrays()
+        return (Ra_est[days], Ra[days])
+
+    Ra_est = numpy.empty(len(days))
+    Ra = numpy.empty(len(days))
+    for lat in latitudes:
+        (table_est, table_ra) = solar_table(float(lat)).as_arrays()
+        mask = latitude == lat
+        Ra_est[mask] = table_est[days[mask]]
+        Ra[mask] = table_ra[days[mask]]
+    return (Ra_est, Ra)
 
 
 if __name__ == '__main__':
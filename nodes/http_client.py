@@ -0,0 +1,246 @@
+#
+#  Shared HTTP client for the OpenWeatherMap queries
+#
+#  All requests to the API go through a single persistent session so that
+#  the TCP/TLS connection is kept alive between polls. The session uses a
+#  bounded connection pool, a small retry policy for transient failures
+#  and connect/read timeouts so that a stalled socket can't block the
+#  poll thread forever.
+#
+#  Responses are requested gzip compressed (requests/urllib3 decompress
+#  them transparently) and decoded with the fastest JSON library
+#  available, see jsoncodec.
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import re
+import time
+import logging
+import threading
+import concurrent.futures
+import requests
+from nodes import jsoncodec
+from nodes import timing
+from requests.adapters import HTTPAdapter
+try:
+    from urllib3.util.retry import Retry
+except ImportError:
+    from requests.packages.urllib3.util.retry import Retry
+
+LOGGER = polyinterface.LOGGER
+
+# Defaults, in seconds for the timeouts.
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+POOL_SIZE = 4
+RETRIES = 2
+BACKOFF = 0.5
+
+# Size of the reads when a response is streamed
+CHUNK_SIZE = 8192
+
+APPID = re.compile(r'appid=[^&\s\'"]*')
+
+
+# Remove the API key from a message, requests errors include the URL
+def redact(message):
+    return APPID.sub('appid=xxxx', str(message))
+
+
+# urllib3 logs the URL of retried (and, at debug, all) requests. Logger
+# filters don't apply to child loggers so each one needs it.
+class RedactFilter(logging.Filter):
+    def filter(self, record):
+        message = record.getMessage()
+        if 'appid=' in message:
+            record.msg = redact(message)
+            record.args = ()
+        return True
+
+for name in ('urllib3.connectionpool', 'urllib3.util.retry'):
+    logging.getLogger(name).addFilter(RedactFilter())
+
+
+# What happened to the last request made on this thread: how many times
+# it was sent again and the final status code.
+_last = threading.local()
+
+
+# Counts the retries that reached the server (not the failed connection
+# attempts) so they can be charged to the API call quota.
+class CountingRetry(Retry):
+    def increment(self, method=None, url=None, response=None, error=None, *args, **kwargs):
+        retry = super(CountingRetry, self).increment(method, url, response, error, *args, **kwargs)
+        if error is None or not self._is_connection_error(error):
+            _last.retries = getattr(_last, 'retries', 0) + 1
+        return retry
+
+HEADERS = {
+        'Accept': 'application/json',
+        'Accept-Encoding': 'gzip, deflate',
+        }
+
+
+class HttpClient:
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 pool_size=POOL_SIZE, retries=RETRIES):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.retries = retries
+        self.session = None
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _build_session(self):
+        retry_args = {
+                'total': self.retries,
+                'connect': self.retries,
+                'read': self.retries,
+                'backoff_factor': BACKOFF,
+                'status_forcelist': (500, 502, 503, 504),
+                'raise_on_status': False,
+                }
+        try:
+            retry = CountingRetry(allowed_methods=frozenset(['GET']), **retry_args)
+        except TypeError:
+            # older urllib3 versions
+            retry = CountingRetry(method_whitelist=frozenset(['GET']), **retry_args)
+
+        adapter = HTTPAdapter(pool_connections=self.pool_size,
+                              pool_maxsize=self.pool_size,
+                              max_retries=retry,
+                              pool_block=True)
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def configure(self, connect_timeout=None, read_timeout=None):
+        if connect_timeout is not None:
+            self.connect_timeout = float(connect_timeout)
+        if read_timeout is not None:
+            self.read_timeout = float(read_timeout)
+
+    def get_session(self):
+        with self.lock:
+            if self.session is None:
+                self.session = self._build_session()
+            return self.session
+
+    # Number of times the last request on this thread was sent again
+    def last_retries(self):
+        return getattr(_last, 'retries', 0)
+
+    # Status code of the last request on this thread, None if there was
+    # no reply
+    def last_status(self):
+        return getattr(_last, 'status', None)
+
+    def _start(self):
+        _last.retries = 0
+        _last.status = None
+
+    # Make a GET request and return the decoded JSON data or None if
+    # the request failed for any reason.
+    # Failed and timed out requests are timed too.
+    def get_json(self, url):
+        timings = timing.get_timings()
+        start = time.monotonic()
+        received = None
+        self._start()
+        try:
+            c = self.get_session().get(url, timeout=(self.connect_timeout, self.read_timeout))
+            _last.status = c.status_code
+            try:
+                if c.status_code != 200:
+                    LOGGER.error('HTTP request returned status %d' % c.status_code)
+                    return None
+                body = c.content
+                received = time.monotonic()
+                with timings.span('decode'):
+                    jdata = jsoncodec.loads(body)
+            finally:
+                c.close()
+        except requests.exceptions.Timeout:
+            LOGGER.error('HTTP request timed out')
+            return None
+        except Exception as e:
+            LOGGER.error('HTTP request failed: ' + redact(e))
+            return None
+        finally:
+            timings.record('http', (received or time.monotonic()) - start)
+
+        return jdata
+
+    # Make a GET request and pass the body, as an iterator of chunks, to
+    # handler while it's being received. Returns what handler returns or
+    # None if the request or the handler failed.
+    # The time is recorded as 'http', it includes the handler's work since
+    # that runs while the body is received.
+    def get_stream(self, url, handler):
+        start = time.monotonic()
+        self._start()
+        try:
+            c = self.get_session().get(url, timeout=(self.connect_timeout, self.read_timeout), stream=True)
+            _last.status = c.status_code
+            try:
+                if c.status_code != 200:
+                    LOGGER.error('HTTP request returned status %d' % c.status_code)
+                    return None
+                data = handler(c.iter_content(chunk_size=CHUNK_SIZE))
+            finally:
+                c.close()
+        except requests.exceptions.Timeout:
+            LOGGER.error('HTTP request timed out')
+            return None
+        except Exception as e:
+            LOGGER.error('HTTP request failed: ' + redact(e))
+            return None
+        finally:
+            timing.get_timings().record('http', time.monotonic() - start)
+
+        return data
+
+    # Run a list of (function, args) calls in parallel on a small thread
+    # pool and return their results in the same order. The pool is no
+    # bigger than the connection pool so every worker gets a connection.
+    def run_concurrent(self, calls):
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='owm_fetch')
+            executor = self.executor
+
+        futures = [executor.submit(func, *args) for (func, args) in calls]
+        results = []
+        for f in futures:
+            try:
+                results.append(f.result())
+            except Exception as e:
+                LOGGER.error('Concurrent request failed: ' + redact(e))
+                results.append(None)
+        return results
+
+    def close(self):
+        with self.lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+
+# The single client instance shared by every node in the process.
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
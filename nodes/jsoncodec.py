@@ -0,0 +1,46 @@
+#
+#  JSON decoding backend
+#
+#  Responses are decoded with the fastest JSON library that is installed.
+#  orjson and ujson are optional, the standard json module is always
+#  available and is used when neither of them is.
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+if orjson is not None:
+    BACKEND = 'orjson'
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode('utf-8')
+
+elif ujson is not None:
+    BACKEND = 'ujson'
+
+    def loads(data):
+        return ujson.loads(data)
+
+    def dumps(obj):
+        return ujson.dumps(obj)
+
+else:
+    BACKEND = 'json'
+
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(obj):
+        return json.dumps(obj)
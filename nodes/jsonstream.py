@@ -0,0 +1,117 @@
+#
+#  Streaming JSON decode
+#
+#  The forecast response is a JSON object with a large 'list' array of
+#  entries. Decoding the whole document builds every entry before the
+#  first one is used. ArrayStream reads the response a chunk at a time
+#  and yields the entries of one top level array as they're decoded so
+#  only one entry (plus a read buffer) needs to be in memory at a time.
+#  The other top level members are decoded normally and kept in header.
+
+import json
+import codecs
+
+WHITESPACE = ' \t\n\r'
+
+# What can follow a number in a valid document
+NUMBER_END = ',}]' + WHITESPACE
+NUMBERS = (int, float)
+
+
+class ArrayStream:
+    # chunks is an iterable of bytes (response.iter_content()), key is
+    # the name of the top level array to stream.
+    def __init__(self, chunks, key):
+        self.chunks = iter(chunks)
+        self.key = key
+        self.header = {}
+        self.found = False      # True once the array has been seen
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    # Add the next chunk to the buffer. Returns False at the end of the
+    # data.
+    def _read(self):
+        if self.eof:
+            return False
+
+        # drop what's been used so the buffer doesn't keep growing
+        if self.pos > 0:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+
+        for chunk in self.chunks:
+            if chunk:
+                self.buf += self.text.decode(chunk)
+                return True
+
+        self.buf += self.text.decode(b'', final=True)
+        self.eof = True
+        return False
+
+    # Return the next character that isn't whitespace without using it
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._read():
+                raise ValueError('Unexpected end of JSON data')
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError('Expected "%s" at offset %d' % (char, self.pos))
+        self.pos += 1
+
+    # Decode the next complete value. A number may be cut off at the end of
+    # a chunk (raw_decode takes '0.' as 0) so it's only accepted once the
+    # character after it can end a number.
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                (value, end) = self.decoder.raw_decode(self.buf, self.pos)
+                if self.eof or (end < len(self.buf) and
+                        (not isinstance(value, NUMBERS) or self.buf[end] in NUMBER_END)):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self._read()
+
+    def __iter__(self):
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+
+        while True:
+            name = self._value()
+            self._expect(':')
+
+            if name == self.key and self._peek() == '[':
+                self.found = True
+                self.pos += 1
+                if self._peek() == ']':
+                    self.pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._peek() == ',':
+                            self.pos += 1
+                            continue
+                        self._expect(']')
+                        break
+            else:
+                self.header[name] = self._value()
+
+            if self._peek() == ',':
+                self.pos += 1
+                continue
+            self._expect('}')
+            break
@@ -0,0 +1,149 @@
+#
+#  Location resolution
+#
+#  The Location custom parameter can be a zip code, a city name, a city
+#  id or a lat/lon pair. It is resolved once, using the current weather
+#  query, into a canonical record with the city id, coordinates and
+#  timezone offset. The record is saved in customData and only thrown
+#  away when the Location parameter changes.
+#
+#  Several locations can be given, separated by ';'. Each one becomes a
+#  site with its own set of nodes.
+
+import re
+
+# customData key used to persist the resolved locations
+CUSTOM_DATA_KEY = 'locations'
+
+# character used to separate multiple locations in the parameter
+SEPARATOR = ';'
+
+
+# Split the Location parameter into the individual locations
+def split_locations(locations):
+    return [l.strip() for l in locations.split(SEPARATOR) if l.strip() != '']
+
+
+# Turn the Location parameter into the query string fragment the API
+# expects.
+def location_query(location):
+    # if location looks like a zip code, treat it as such for backwards
+    # compatibility
+    if re.fullmatch(r'\d\d\d\d\d,..', location) != None:
+        return 'zip=' + location
+    elif re.fullmatch(r'\d\d\d\d\d', location) != None:
+        return 'zip=' + location
+    return location
+
+
+class Location:
+    def __init__(self, location, city_id, latitude, longitude, timezone=0, name=''):
+        self.location = location     # Location parameter this was resolved from
+        self.city_id = city_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.timezone = timezone     # offset from UTC in seconds
+        self.name = name
+
+    # Query string fragment used for the weather and forecast endpoints.
+    # When the user gave us coordinates, keep using them, otherwise the
+    # city id is the most precise way to ask for the same place.
+    def query(self):
+        if self.city_id and not self.location.startswith('lat='):
+            return 'id=' + str(self.city_id)
+        return self.coord_query()
+
+    # Query string fragment used for the coordinate based endpoints (uvi)
+    def coord_query(self):
+        return 'lat=' + str(self.latitude) + '&lon=' + str(self.longitude)
+
+    def matches(self, location):
+        return self.location == location
+
+    def to_dict(self):
+        return {
+                'location': self.location,
+                'id': self.city_id,
+                'lat': self.latitude,
+                'lon': self.longitude,
+                'timezone': self.timezone,
+                'name': self.name,
+                }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['location'], data['id'], data['lat'], data['lon'],
+                   data.get('timezone', 0), data.get('name', ''))
+
+    # Build the record from a current conditions (weather) response
+    @classmethod
+    def from_weather(cls, location, jdata):
+        return cls(location, jdata.get('id', 0), jdata['coord']['lat'],
+                   jdata['coord']['lon'], jdata.get('timezone', 0),
+                   jdata.get('name', ''))
+
+    def __str__(self):
+        return '%s (id=%s lat=%s lon=%s tz=%s)' % (self.name, self.city_id, self.latitude, self.longitude, self.timezone)
+
+
+# One configured location and the nodes that show its data. The first
+# site uses the controller node for the current conditions and keeps the
+# original forecast node addresses.
+class Site:
+    def __init__(self, index, location):
+        self.index = index
+        self.location = location   # entry from the Location parameter
+        self.record = None         # resolved Location record
+
+    def is_primary(self):
+        return self.index == 0
+
+    def conditions_address(self, controller_address):
+        if self.is_primary():
+            return controller_address
+        return 'site_' + str(self.index)
+
+    def conditions_name(self):
+        if self.record is not None and self.record.name != '':
+            return self.record.name
+        return 'Weather ' + str(self.index)
+
+    def forecast_address(self, day):
+        if self.is_primary():
+            return 'forecast_' + str(day)
+        return 'forecast_' + str(self.index) + '_' + str(day)
+
+    def forecast_name(self, day):
+        if self.is_primary():
+            return 'Forecast ' + str(day)
+        return 'Forecast ' + str(self.index) + '-' + str(day)
+
+    def __str__(self):
+        if self.record is not None:
+            return str(self.record)
+        return self.location
+
+
+# Load a previously resolved location from customData. Returns None if
+# nothing was saved for this Location.
+def load(custom_data, location):
+    if custom_data is None or CUSTOM_DATA_KEY not in custom_data:
+        return None
+
+    try:
+        record = Location.from_dict(custom_data[CUSTOM_DATA_KEY][location])
+    except (KeyError, TypeError):
+        return None
+
+    if not record.matches(location):
+        return None
+    return record
+
+
+# Build the customData entry for all of the resolved sites
+def save(sites):
+    records = {}
+    for site in sites:
+        if site.record is not None:
+            records[site.location] = site.record.to_dict()
+    return {CUSTOM_DATA_KEY: records}
@@ -0,0 +1,99 @@
+#
+#  OpenWeatherMap One Call API support
+#
+#  A single One Call request returns the current conditions, the UV
+#  index and a daily forecast for the location. These functions convert
+#  that response into the same records that the 2.5 weather and
+#  forecast endpoints produce so the controller and forecast nodes don't
+#  need to know which API was used.
+#
+#  One Call is version 3.0 of the API and needs a One Call subscription
+#  for the API key.
+#
+#  https://openweathermap.org/api/one-call-3
+
+from nodes import aggregate
+
+# parts of the response we don't use
+EXCLUDE = 'minutely,hourly,alerts'
+
+
+# Convert the 'current' section into the weather endpoint format
+def conditions(jdata):
+    current = jdata['current']
+
+    main = {
+            'temp': current['temp'],
+            'humidity': current['humidity'],
+            'pressure': current['pressure'],
+            }
+
+    # The current section doesn't have today's high/low, use the first
+    # day of the daily forecast for that.
+    if 'daily' in jdata and len(jdata['daily']) > 0:
+        main['temp_max'] = jdata['daily'][0]['temp']['max']
+        main['temp_min'] = jdata['daily'][0]['temp']['min']
+    else:
+        main['temp_max'] = current['temp']
+        main['temp_min'] = current['temp']
+
+    record = {'main': main}
+
+    wind = {}
+    if 'wind_speed' in current:
+        wind['speed'] = current['wind_speed']
+    if 'wind_gust' in current:
+        wind['gust'] = current['wind_gust']
+    if 'wind_deg' in current:
+        wind['deg'] = current['wind_deg']
+    record['wind'] = wind
+
+    if 'visibility' in current:
+        record['visibility'] = current['visibility']
+    if 'clouds' in current:
+        record['clouds'] = {'all': current['clouds']}
+    if 'weather' in current:
+        record['weather'] = current['weather']
+    for tag in ('rain', 'snow'):
+        if tag in current:
+            record[tag] = current[tag]
+
+    return record
+
+
+def uv_index(jdata):
+    if 'uvi' in jdata['current']:
+        return jdata['current']['uvi']
+    return None
+
+
+# Convert the 'daily' section into the list of daily forecast records
+# used by the forecast nodes. precipitation is called to convert the
+# rain/snow values (always mm) to the configured units.
+def daily_forecast(jdata, precipitation):
+    fcast = []
+    tz_offset = int(jdata.get('timezone_offset', 0))
+
+    for day in jdata.get('daily', []):
+        local_day = aggregate.day_id(day['dt'], tz_offset)
+        fcast.append(aggregate.ForecastDay(
+            day['dt'],
+            float(day['temp']['max']),
+            float(day['temp']['min']),
+            float(day['humidity']),
+            float(day['humidity']),
+            float(day['pressure']),
+            float(day['weather'][0]['id']),
+            float(day['wind_speed']),
+            float(day['wind_deg']),
+            float(day['clouds']),
+            precipitation(float(day.get('rain', 0))),
+            precipitation(float(day.get('snow', 0))),
+            # a daily entry covers the whole day, the same as a full set
+            # of 8 three hour entries.
+            8,
+            float(day.get('uvi', 0)),
+            aggregate.day_of_week(local_day),
+            aggregate.day_of_year(local_day)))
+
+    return fcast
@@ -11,17 +11,40 @@ except ImportError:
 import sys
 import time
 import datetime
+import threading
 import requests
 import socket
 import math
 import re
 import json
+import logging
+import contextlib
 import node_funcs
 from nodes import owm_daily
+from nodes import owm_conditions
 from nodes import uom
+from nodes import http_client
+from nodes import location
+from nodes import cache
+from nodes import onecall
+from nodes import scheduler
+from nodes import quota
+from nodes import aggregate
+from nodes import jsonstream
+from nodes import urls
+from nodes import timing
+from nodes import profiler
+from nodes import trace
 
 LOGGER = polyinterface.LOGGER
 
+# The group endpoint accepts at most this many city ids
+MAX_GROUP = 20
+
+# Endpoints whose 'list' array is streamed into the aggregator instead
+# of being decoded all at once
+STREAMED = ('forecast',)
+
 @node_funcs.add_functions_as_methods(node_funcs.functions)
 class Controller(polyinterface.Controller):
     id = 'weather'
@@ -35,6 +58,17 @@ class Controller(polyinterface.Controller):
         self.configured = False
         self.discovery = False
         self.start_finished = False
+        self.http = http_client.get_client()
+        self.concurrent_fetch = True
+        self.sites = []
+        self.cache = cache.ResponseCache()
+        self.scheduler = scheduler.PollScheduler()
+        self.quota = quota.QuotaManager()
+        self.poll_timer = None
+        self.poll_lock = threading.Lock()
+        self.timings = timing.get_timings()
+        self.profiler = profiler.get_profiler()
+        self.trace = trace.get_sampler()
 
         self.params = node_funcs.NSParameters([{
             'name': 'APIkey',
@@ -72,8 +106,52 @@ class Controller(polyinterface.Controller):
             'isRequired': False,
             'notice': '',
             },
+            {
+            'name': 'Connect Timeout',
+            'default': str(http_client.CONNECT_TIMEOUT),
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Read Timeout',
+            'default': str(http_client.READ_TIMEOUT),
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'One Call API',
+            'default': 'false',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Calls Per Minute',
+            'default': str(quota.CALLS_PER_MINUTE),
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Calls Per Day',
+            'default': str(quota.CALLS_PER_DAY),
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Disk Cache',
+            'default': 'false',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Trace Cycles',
+            'default': '0',
+            'isRequired': False,
+            'notice': '',
+            },
             ])
 
+        self.urls = urls.RequestUrls(self.params)
+
         self.poly.onConfig(self.process_config)
 
     # Process changes to customParameters
@@ -87,9 +165,20 @@ class Controller(polyinterface.Controller):
             LOGGER.debug('-- configuration is valid')
             self.removeNoticesAll()
             self.configured = True
-            if self.params.isChanged('Forecast Days'):
+            self.configure_http()
+            self.configure_cache()
+            self.configure_quota()
+            self.configure_trace()
+            # The sites are only built once the configuration is valid,
+            # so they're missing if it wasn't valid at start.
+            new_sites = self.params.isChanged('Location') or len(self.sites) == 0
+            if new_sites:
+                LOGGER.info('Location changed, it will be resolved again')
+                self.build_sites()
+                self.scheduler.forget()
+            if self.params.isChanged('Forecast Days') or new_sites:
                 if self.start_finished:
-                    LOGGER.info('calling discover because forecast days set and ' + str(self.start_finished))
+                    LOGGER.info('calling discover because forecast days or location set and ' + str(self.start_finished))
                     self.discover()
                     self.initialize()
         elif valid:
@@ -109,117 +198,403 @@ class Controller(polyinterface.Controller):
 
     def initialize(self):
         time.sleep(2)  # give things some time to settle
-        self.query_conditions()
-        self.query_forecast()
+        with self.poll_cycle():
+            if self.use_onecall():
+                self.query_onecall()
+            else:
+                self.query_conditions()
+                self.query_forecast()
+        self.update_quota_driver()
+        self.update_timing_drivers()
+        self.schedule_next_poll()
 
     def longPoll(self):
-        self.query_forecast()
+        with self.poll_cycle():
+            if self.use_onecall():
+                self.query_onecall(conditions=False)
+            else:
+                self.query_forecast()
+        self.update_quota_driver()
+        self.update_timing_drivers()
 
     def shortPoll(self):
-        self.query_conditions()
+        if not self.conditions_due():
+            if LOGGER.isEnabledFor(logging.DEBUG):
+                LOGGER.debug('Skipping poll, no new data expected for %d seconds',
+                        self.scheduler.seconds_until_due(self.schedule_keys()))
+            self.update_timing_drivers()
+            return
+        self.poll_conditions()
+
+    # A poll cycle is timed, can be profiled (the PROFILE command) and
+    # every Nth one is logged in full (Trace Cycles).
+    @contextlib.contextmanager
+    def poll_cycle(self):
+        with self.trace.cycle(), self.timings.span('cycle'), self.profiler.cycle():
+            yield
+
+    # Query the current conditions, asking for fresh data, and schedule
+    # the next query for just after the data is expected to change.
+    def poll_conditions(self):
+        if not self.poll_lock.acquire(blocking=False):
+            LOGGER.debug('Current conditions query already running')
+            return
+        try:
+            with self.poll_cycle():
+                if self.use_onecall():
+                    self.query_onecall(forecast=False, refresh=True)
+                else:
+                    self.query_conditions(refresh=True)
+        finally:
+            self.poll_lock.release()
+        self.update_quota_driver()
+        self.update_timing_drivers()
+        self.schedule_next_poll()
+
+    # Scheduler keys for the current conditions of each site
+    def schedule_keys(self):
+        return ['conditions_' + str(site.index) for site in self.sites]
+
+    def conditions_due(self):
+        if len([s for s in self.sites if s.record is None]) > 0:
+            return True
+        for key in self.schedule_keys():
+            if self.scheduler.is_due(key):
+                return True
+        return False
+
+    # If new data is expected before the next short poll, set a timer to
+    # query right after it's available. Only locations that have returned
+    # data are timed, the others are left to the short poll, and the timer
+    # is never shorter than the retry interval so failing queries can't
+    # loop.
+    def schedule_next_poll(self):
+        if not self.configured:
+            return
+
+        if self.poll_timer is not None:
+            self.poll_timer.cancel()
+            self.poll_timer = None
+
+        keys = [k for k in self.schedule_keys() if self.scheduler.has_data(k)]
+        if len(keys) == 0:
+            return
+        delay = max(self.scheduler.seconds_until_due(keys), self.scheduler.retry)
+        try:
+            short_poll = int(self.polyConfig['shortPoll'])
+        except:
+            short_poll = 300
+
+        if delay < short_poll:
+            LOGGER.debug('Next current conditions query in %d seconds', delay)
+            self.poll_timer = threading.Timer(delay, self.poll_conditions)
+            self.poll_timer.daemon = True
+            self.poll_timer.start()
+
+    # Create a site for each location in the Location parameter, using
+    # the saved location records when we have them.
+    def build_sites(self):
+        custom_data = self.polyConfig['customData'] if 'customData' in self.polyConfig else None
+        self.sites = []
+        for loc in location.split_locations(self.params.get('Location')):
+            site = location.Site(len(self.sites), loc)
+            site.record = location.load(custom_data, loc)
+            if site.record is not None:
+                LOGGER.info('Using saved location ' + str(site.record))
+            self.sites.append(site)
+
+    # The node that displays the current conditions for a site
+    def conditions_node(self, site):
+        return self.nodes[site.conditions_address(self.address)]
+
+    # Elevation can be a single value or one value per location
+    def site_elevation(self, site):
+        elevations = location.split_locations(self.params.get('Elevation'))
+        if site.index < len(elevations):
+            return elevations[site.index]
+        return elevations[0] if len(elevations) > 0 else '0'
 
     # extra = weather or forecast or uvi
-    def get_weather_data(self, extra, lat=None, lon=None):
-        request = 'http://api.openweathermap.org/data/2.5/' + extra + '?'
-        if 'uvi' in extra:
-            request += 'lat=' + str(lat)
-            request += '&lon=' + str(lon)
+    #
+    # Requests are built from the site's resolved location record. The only
+    # request made without one is the weather query that resolves it.
+    #
+    # refresh asks for data newer than the cache TTL would normally allow.
+    def get_weather_data(self, extra, site=None, refresh=False):
+        if site is None:
+            site = self.sites[0]
+
+        if site.record is None:
+            query = self.urls.location_query(site.location)
+        elif 'uvi' in extra or extra == 'onecall':
+            query = site.record.coord_query()
         else:
-            # if location looks like a zip code, treat it as such for backwards
-            # compatibility
-            if re.fullmatch(r'\d\d\d\d\d,..', self.params.get('Location')) != None:
-                request += 'zip=' + self.params.get('Location')
-            elif re.fullmatch(r'\d\d\d\d\d', self.params.get('Location')) != None:
-                request += 'zip=' + self.params.get('Location')
+            query = site.record.query()
+
+        if site.record is not None:
+            key = self.cache_key(site)
+        else:
+            key = None
+
+        return self.request(extra, query, key, refresh)
+
+    # Current conditions for several sites with a single group request.
+    # Returns a dictionary of the weather records indexed by city id.
+    def get_group_data(self, sites, refresh=False):
+        ids = []
+        for site in sites:
+            if str(site.record.city_id) not in ids:
+                ids.append(str(site.record.city_id))
+        query = 'id=' + ','.join(ids)
+        jdata = self.request('group', query, query + '&units=' + self.params.get('Units'), refresh)
+        if jdata is None or 'list' not in jdata:
+            return {}
+        return {w['id']: w for w in jdata['list'] if 'id' in w}
+
+    # Make the request, through the cache when key isn't None. query is
+    # the location part of the query, the rest comes from the URL
+    # templates.
+    def request(self, extra, query, key, refresh=False):
+        request = self.urls.url(extra, query)
+
+        def fetch():
+            if not self.quota.acquire(self.params.get('APIkey'), extra):
+                return None
+            LOGGER.debug('request = %s', http_client.redact(request))
+            if extra in STREAMED:
+                jdata = self.http.get_stream(request, self.read_list_stream)
             else:
-                request += self.params.get('Location')
-            request += '&units=' + self.params.get('Units')
+                jdata = self.http.get_json(request)
+            if self.http.last_retries() > 0:
+                self.quota.charge(self.params.get('APIkey'), self.http.last_retries())
+            if self.http.last_status() == 429:
+                self.quota.throttle(self.params.get('APIkey'))
+            if jdata is None:
+                LOGGER.error('HTTP request failed for api.openweathermap.org')
+                self.timings.error(extra)
+            elif LOGGER.isEnabledFor(logging.DEBUG):
+                LOGGER.debug('%s', jdata)
+            return jdata
+
+        if key is None:
+            return fetch()
+        max_age = scheduler.RETRY if refresh else None
+        return self.cache.get(extra, key, fetch, max_age)
+
+    # Decode a response with a 'list' array without building the list.
+    # The entries are read straight into the forecast columns and the
+    # columns replace 'list' in the returned data.
+    def read_list_stream(self, chunks):
+        stream = jsonstream.ArrayStream(chunks, 'list')
+        (dt, cols) = aggregate.read_columns(stream)
+        jdata = stream.header
+        if stream.found:
+            jdata['columns'] = aggregate.columns_to_dict(dt, cols)
+        return jdata
 
-        request += '&appid=' + self.params.get('APIkey')
+    # Responses are cached per endpoint for the resolved location. The
+    # units are part of the key since they change the values returned.
+    def cache_key(self, site):
+        return site.record.query() + '&units=' + self.params.get('Units')
+
+    # Run a list of (function, args) calls, in parallel when concurrent
+    # fetching is enabled. The results are returned in the same order.
+    def run_requests(self, calls):
+        if self.concurrent_fetch and len(calls) > 1 and not self.profiler.profiling_cpu():
+            return self.http.run_concurrent(calls)
+        return [func(*args) for (func, args) in calls]
+
+    # Resolve the site's location into a location record, using a current
+    # conditions query. The weather data used to resolve it is returned so
+    # the caller doesn't have to query again.
+    def resolve_location(self, site):
+        site.record = None
+        jdata = self.get_weather_data('weather', site)
+        if jdata is None or 'coord' not in jdata:
+            LOGGER.error('Failed to resolve location ' + site.location)
+            return None
+
+        site.record = location.Location.from_weather(site.location, jdata)
+        LOGGER.info('Location resolved to ' + str(site.record))
+        self.save_custom_data(location.save(self.sites))
+        self.cache.put('weather', self.cache_key(site), jdata)
+        return jdata
 
-        LOGGER.debug('request = %s' % request)
-        try:
-            c = requests.get(request)
-            jdata = c.json()
-            c.close()
-            LOGGER.debug(jdata)
-        except:
-            LOGGER.error('HTTP request failed for api.openweathermap.org')
-            jdata = None
+    # Make sure every site has a location record. Returns the weather
+    # data from the sites that had to be resolved, indexed by site.
+    def resolve_sites(self):
+        resolved = {}
+        for site in self.sites:
+            if site.record is None:
+                jdata = self.resolve_location(site)
+                if jdata is not None:
+                    resolved[site.index] = jdata
+        return resolved
+
+    # Turn the disk backed cache on or off
+    def configure_cache(self):
+        if self.params.get('Disk Cache').lower() == 'true':
+            self.cache.set_directory(cache.CACHE_DIR)
+        else:
+            self.cache.set_directory(None)
 
-        return jdata
+    def configure_quota(self):
+        try:
+            self.quota.configure(self.params.get('Calls Per Minute'), self.params.get('Calls Per Day'))
+        except ValueError:
+            LOGGER.error('Invalid API call limit, using defaults')
+            self.quota.configure(quota.CALLS_PER_MINUTE, quota.CALLS_PER_DAY)
 
+    def configure_trace(self):
+        try:
+            self.trace.configure(self.params.get('Trace Cycles'))
+        except ValueError:
+            LOGGER.error('Invalid Trace Cycles, trace logging is off')
+            self.trace.configure(0)
+
+    # Show how many API calls are left for today
+    def update_quota_driver(self):
+        self.update_driver('GV15', self.quota.remaining_today(self.params.get('APIkey')))
+
+    # Show how long the last API request and poll took, how many requests
+    # failed and how old the current conditions are.
+    def update_timing_drivers(self):
+        self.update_driver('GV16', round(self.timings.last('http') * 1000))
+        self.update_driver('GV21', round(self.timings.last('cycle') * 1000))
+        self.update_driver('GV22', self.timings.error_count())
+        age = self.timings.age('conditions')
+        self.update_driver('GV23', max(0, round(age)) if age is not None else 0)
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            for (name, t) in sorted(self.timings.summary().items()):
+                LOGGER.debug('%s: last %.1fms p50 %.1fms p90 %.1fms p99 %.1fms (%d)' %
+                        (name, t['last'], t['p50'], t['p90'], t['p99'], t['count']))
+
+    # Apply the configured connect/read timeouts to the shared HTTP client
+    def configure_http(self):
+        try:
+            self.http.configure(self.params.get('Connect Timeout'), self.params.get('Read Timeout'))
+        except ValueError:
+            LOGGER.error('Invalid timeout value, using defaults')
+            self.http.configure(http_client.CONNECT_TIMEOUT, http_client.READ_TIMEOUT)
 
-    def query_conditions(self, force=False):
+    def query_conditions(self, force=False, refresh=False):
         # Query for the current conditions. We can do this fairly
         # frequently, probably as often as once a minute.
         #
         # By default JSON is returned
         # http://api.openweathermap.org/data/2.5/weather?
+        #
+        # With more than one location, the current conditions for all of
+        # them come from a single group request.
 
         if not self.configured:
             LOGGER.info('Skipping connection because we aren\'t configured yet.')
             return
 
         try:
-            jdata = self.get_weather_data('weather')
+            conditions = self.resolve_sites()
+            sites = [s for s in self.sites if s.record is not None]
+            pending = [s for s in sites if s.index not in conditions]
+
+            if len(pending) > 1:
+                grouped = [s for s in pending if s.record.city_id]
+            else:
+                grouped = []
+            single = [s for s in pending if s not in grouped]
+
+            calls = []
+            for i in range(0, len(grouped), MAX_GROUP):
+                calls.append((self.get_group_data, (grouped[i:i + MAX_GROUP], refresh)))
+            for site in single:
+                calls.append((self.get_weather_data, ('weather', site, refresh)))
+            for site in sites:
+                calls.append((self.get_weather_data, ('uvi', site)))
+
+            results = self.run_requests(calls)
+
+            group_data = {}
+            for i in range(0, len(grouped), MAX_GROUP):
+                group_data.update(results.pop(0) or {})
+            for site in grouped:
+                conditions[site.index] = group_data.get(site.record.city_id)
+            for site in single:
+                conditions[site.index] = results.pop(0)
+            uv_data = results
+
+            # TODO: Query for pollution data
+        except Exception as e:
+            LOGGER.error('Weather data query failed: ' + str(e))
+            if refresh:
+                for site in self.sites:
+                    self.scheduler.miss('conditions_' + str(site.index))
+            return
 
+        for (site, uv) in zip(sites, uv_data):
+            jdata = conditions.get(site.index)
             if jdata == None:
-                LOGGER.error('Query returned no data')
-                return
+                LOGGER.error('Query returned no data for ' + site.location)
+                if refresh:
+                    self.scheduler.miss('conditions_' + str(site.index))
+                continue
 
-            self.latitude = jdata['coord']['lat']
-            self.longitude = jdata['coord']['lon']
+            if uv == None:
+                LOGGER.error('UV query returned no data')
 
-            try:
-                uv_data = self.get_weather_data('uvi', self.latitude, self.longitude)
-                if uv_data != None:
-                    LOGGER.debug('UV index = %f' % uv_data['value'])
-                    self.update_driver('UV', uv_data['value'], force)
-                else:
-                    LOGGER.error('UV query returned no data')
-            except:
-                LOGGER.error('Failed to query for UV data')
+            if 'dt' in jdata:
+                self.scheduler.observe('conditions_' + str(site.index), jdata['dt'], refresh)
 
+            try:
+                uv = uv['value'] if uv is not None and 'value' in uv else None
+                with self.timings.span('conditions.update'):
+                    self.update_conditions(self.conditions_node(site), jdata, uv, force)
+                # The age is of the data, a cached response is as old as
+                # its dt
+                if 'dt' in jdata:
+                    self.timings.mark_good('conditions', int(jdata['dt']))
+            except Exception as e:
+                LOGGER.error('Failed to update conditions for ' + site.location + ': ' + str(e))
 
-            # TODO: Query for pollution data
-        except:
-            LOGGER.error('Weather data query failed')
-            return
+    # Update a node's drivers from a current conditions record. This is in
+    # the format returned by the weather endpoint, the One Call data is
+    # converted to it. node is the controller for the first location and
+    # a conditions node for the others.
+    def update_conditions(self, node, jdata, uv=None, force=False):
+        if uv is not None:
+            LOGGER.debug('UV index = %f', uv)
+            node.update_driver('UV', uv, force)
 
         # Assume we always get the main section with data
-        self.update_driver('CLITEMP', jdata['main']['temp'], force)
-        self.update_driver('CLIHUM', jdata['main']['humidity'], force)
-        self.update_driver('BARPRES', jdata['main']['pressure'], force)
-        self.update_driver('GV0', jdata['main']['temp_max'], force)
-        self.update_driver('GV1', jdata['main']['temp_min'], force)
+        node.update_driver('CLITEMP', jdata['main']['temp'], force)
+        node.update_driver('CLIHUM', jdata['main']['humidity'], force)
+        node.update_driver('BARPRES', jdata['main']['pressure'], force)
+        node.update_driver('GV0', jdata['main']['temp_max'], force)
+        node.update_driver('GV1', jdata['main']['temp_min'], force)
         if 'wind' in jdata:
             # Wind data is apparently flaky so check to make sure it exist.
             if 'speed' in jdata['wind']:
-                self.update_driver('GV4', jdata['wind']['speed'], force)
+                node.update_driver('GV4', jdata['wind']['speed'], force)
             if 'gust' in jdata['wind']:
-                self.update_driver('GV5', jdata['wind']['gust'], force)
+                node.update_driver('GV5', jdata['wind']['gust'], force)
             if 'deg' in jdata['wind']:
-                self.update_driver('WINDDIR', jdata['wind']['deg'], force)
+                node.update_driver('WINDDIR', jdata['wind']['deg'], force)
         if 'visibility' in jdata:
             # always reported in meters convert to either km or miles
             if self.params.get('Units') == 'metric':
                 vis = float(jdata['visibility']) / 1000
             else:
                 vis = float(jdata['visibility']) * 0.000621371
-            self.update_driver('DISTANC', round(vis,1), force)
+            node.update_driver('DISTANC', round(vis,1), force)
 
         rain = self.parse_precipitation(jdata, 'rain')
-        self.update_driver('GV6', round(rain, 2), force)
+        node.update_driver('GV6', round(rain, 2), force)
 
         snow = self.parse_precipitation(jdata, 'snow')
-        self.update_driver('GV7', round(snow, 2), force)
+        node.update_driver('GV7', round(snow, 2), force)
 
         if 'clouds' in jdata:
-            self.update_driver('GV14', jdata['clouds']['all'], force)
+            node.update_driver('GV14', jdata['clouds']['all'], force)
         if 'weather' in jdata:
-            self.update_driver('GV13', jdata['weather'][0]['id'], force)
-        
+            node.update_driver('GV13', jdata['weather'][0]['id'], force)
 
     # parse rain/snow values from data
     def parse_precipitation(self, data, tag):
@@ -230,16 +605,19 @@ class Controller(polyinterface.Controller):
                 snow = float(data[tag]['1h'])
             else:
                 snow = 0
-            LOGGER.debug('Found ' + tag + ' value = ' + str(snow))
-
-            # this is reported in mm, need to convert to inches
-            if self.params.get('Units') == 'imperial':
-                snow *= 0.0393701
+            LOGGER.debug('Found %s value = %s', tag, snow)
+            snow = self.precipitation_units(snow)
         else:
             snow = 0
 
         return snow
 
+    # precipitation is reported in mm, convert to inches if needed
+    def precipitation_units(self, mm):
+        if self.params.get('Units') == 'imperial':
+            return mm * 0.0393701
+        return mm
+
     def query_forecast(self):
         # Three hour forecast for 5 days (or about 30 entries). This
         # is probably too much data to send to the ISY and there isn't
@@ -250,139 +628,135 @@ class Controller(polyinterface.Controller):
             LOGGER.info('Skipping connection because we aren\'t configured yet.')
             return
 
-        try:
-            jdata = self.get_weather_data('forecast')
+        self.resolve_sites()
+        sites = [s for s in self.sites if s.record is not None]
 
-            if jdata == None:
-                LOGGER.error('Query returned no data')
-                return
-
-            uv_data = self.get_weather_data('uvi/forecast', self.latitude, self.longitude)
-            LOGGER.info('Found ' + str(len(uv_data)) + ' UV forecasts')
-            # what if we have no UV data?  below we assume it's there and
-            # crash if it's not.
+        try:
+            calls = []
+            for site in sites:
+                calls.append((self.get_weather_data, ('forecast', site)))
+                calls.append((self.get_weather_data, ('uvi/forecast', site)))
+            results = self.run_requests(calls)
         except:
             LOGGER.error('Foreast query failed.')
             return
 
-        # Free accounts only give us a 3hr/5day forecast so the first step
-        # is to map into days with min/max values.
-        fcast = []
-        LOGGER.info('Forecast has ' + str(jdata['cnt']) + ' lines of data')
-        day = 0
-        fcast.append({})
-        count = 0
-        temp_max = 0
-        temp_min = 200
-        Hmax = 0
-        Hmin = 100
-        pressure = 0
-        weather = 0
-        speed = 0
-        winddir = 0
-        clouds = 0
-        dt = 0
-        uv = 0
-        rain = 0
-        snow = 0
-        dow = -1
-
-        if 'list' in jdata:
-            for forecast in jdata['list']:
-                dt_txt = forecast['dt_txt'].split(' ')
-                LOGGER.info('Day = ' + str(day) + ' - Forecast dt = ' + str(forecast['dt']) + ' ' + time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(forecast['dt'])))
-                # Forecast may optionally have rain or snow data. Should
-                # parse that.
-                rain = self.parse_precipitation(forecast, 'rain')
-                snow = self.parse_precipitation(forecast, 'snow')
-
-                # We should convert 'dt' to local time and use that to determine day breaks.
-                hour = time.strftime('%H', time.localtime(forecast['dt']))
-                LOGGER.info('day = ' + str(dow) + ' hour = ' + hour)
-
-                if dow != time.strftime("%w", time.localtime(forecast['dt'])):
-                    if count != 0:
-                        fcast.append({})
-                        fcast[day] = {
-                            'temp_max': temp_max,
-                            'temp_min': temp_min,
-                            'Hmax': Hmax,
-                            'Hmin': Hmin,
-                            'pressure': pressure / count,
-                            'weather': weather,
-                            'speed': speed / count,
-                            'winddir': winddir / count,
-                            'clouds': clouds / count,
-                            'dt': dt,
-                            'uv': uv,
-                            'rain': rain,
-                            'snow': snow,
-                            'count': count,
-                            }
-                        day += 1
-
-                    temp_max = 0
-                    temp_min = 200
-                    Hmax = 0
-                    Hmin = 100
-                    pressure = 0
-                    weather = 0
-                    speed = 0
-                    winddir = 0
-                    clouds = 0
-                    dt = 0
-                    uv = 0
-                    rain = 0
-                    snow = 0
-                    count = 0
-                    dow = time.strftime("%w", time.localtime(forecast['dt']))
-
-                if 0 <= day < len(uv_data):
-                    uv = float(uv_data[day]['value'])
-                else:
-                    uv = 0.0
-
-                # Build daily forecast data
-                if float(forecast['main']['temp']) > temp_max:
-                    temp_max = float(forecast['main']['temp'])
-                if float(forecast['main']['temp']) < temp_min:
-                    temp_min = float(forecast['main']['temp'])
-                if float(forecast['main']['humidity']) > Hmax:
-                    Hmax = float(forecast['main']['humidity'])
-                if float(forecast['main']['humidity']) < Hmin:
-                    Hmin = float(forecast['main']['humidity'])
-                pressure += float(forecast['main']['pressure'])
-                weather = float(forecast['weather'][0]['id'])
-                speed += float(forecast['wind']['speed'])
-                winddir += float(forecast['wind']['deg'])
-                clouds += float(forecast['clouds']['all'])
-                dt = forecast['dt']
-                uv = uv
-                rain += rain
-                snow += snow
-                count += 1
-
-                
-            LOGGER.info('Created ' + str(day) +' days forecast.')
+        for site in sites:
+            jdata = results.pop(0)
+            uv_data = results.pop(0)
+
+            if jdata == None:
+                LOGGER.error('Query returned no data for ' + site.location)
+                continue
+
+            if uv_data is None:
+                LOGGER.error('UV forecast query returned no data')
+                uv_data = []
+            LOGGER.info('Found %d UV forecasts', len(uv_data))
 
             try:
-                self.removeNotice('noData')
+                with self.timings.span('forecast.aggregate'):
+                    fcast = self.build_forecast(jdata, uv_data, self.site_timezone(site, jdata))
             except Exception as e:
-                LOGGER.error(e)
-
-            for f in range(0,int(self.params.get('Forecast Days'))):
-                address = 'forecast_' + str(f)
-                if f < len(fcast) and fcast[f] != {}:
-                    if fcast[f]['count'] == 8:
-                        self.nodes[address].update_forecast(fcast[f], self.latitude, self.params.get('Elevation'), self.params.get('Plant Type'), self.params.get('Units'))
-                    else:
-                        LOGGER.debug('Skipping update for ' + address + ' because it lacks 8 records.')
-                        try:
-                            self.addNotice('Insufficient data for forecast ' + address, 'noData')
-                        except:
-                            self.addNotice({'noData': 'Insufficent data for forecast ' + address})
+                LOGGER.error('Failed to parse forecast for ' + site.location + ': ' + str(e))
+                continue
+
+            if fcast is not None:
+                with self.timings.span('forecast.nodes'):
+                    self.update_forecast_nodes(site, fcast)
+                self.timings.mark_good('forecast')
+
+    # Free accounts only give us a 3hr/5day forecast so the first step
+    # is to map into days with min/max values.
+    def build_forecast(self, jdata, uv_data, tz_offset=None):
+        if 'columns' in jdata:
+            (dt, cols) = aggregate.columns_from_dict(jdata['columns'])
+        elif 'list' in jdata:
+            (dt, cols) = aggregate.read_columns(jdata['list'])
+        else:
+            return None
+
+        LOGGER.info('Forecast has %d lines of data', len(dt))
+        uv = [float(u['value']) for u in uv_data if 'value' in u]
+        fcast = aggregate.reduce_columns(dt, cols, uv, self.precipitation_units(1.0), tz_offset)
+        LOGGER.info('Created %d days forecast.', len(fcast))
+
+        return fcast
+
+    # Offset from UTC of the site's local time. The forecast response
+    # carries it in the city block, otherwise use the one saved when the
+    # location was resolved.
+    def site_timezone(self, site, jdata=None):
+        try:
+            return int(jdata['city']['timezone'])
+        except (KeyError, TypeError, ValueError):
+            pass
+        if site.record is not None and site.record.timezone is not None:
+            return int(site.record.timezone)
+        return None
+
+    # Push the daily forecast records to the forecast nodes
+    def update_forecast_nodes(self, site, fcast):
+        notice = 'noData' if site.is_primary() else 'noData_' + str(site.index)
+        try:
+            self.removeNotice(notice)
+        except Exception as e:
+            LOGGER.error(e)
+
+        for f in range(0,int(self.params.get('Forecast Days'))):
+            address = site.forecast_address(f)
+            if f < len(fcast):
+                if fcast[f].count == 8:
+                    node = self.nodes[address]
+                    node.update_forecast(fcast[f], site.record.latitude, self.site_elevation(site), self.params.get('Plant Type'), self.params.get('Units'))
                 else:
-                    LOGGER.warning('No forecast information available for day ' + str(f))
+                    LOGGER.debug('Skipping update for %s because it lacks 8 records.', address)
+                    try:
+                        self.addNotice('Insufficient data for forecast ' + address, notice)
+                    except:
+                        self.addNotice({notice: 'Insufficent data for forecast ' + address})
+            else:
+                LOGGER.warning('No forecast information available for day ' + str(f))
+
+    # Query the One Call API. A single request has the current conditions,
+    # UV index and the daily forecast.
+    def query_onecall(self, conditions=True, forecast=True, force=False, refresh=False):
+        if not self.configured:
+            LOGGER.info('Skipping connection because we aren\'t configured yet.')
+            return
+
+        self.resolve_sites()
+        sites = [s for s in self.sites if s.record is not None]
+        calls = [(self.get_weather_data, ('onecall', site, refresh)) for site in sites]
+
+        for (site, jdata) in zip(sites, self.run_requests(calls)):
+            if jdata is None or 'current' not in jdata:
+                LOGGER.error('One Call query returned no data for ' + site.location)
+                if refresh:
+                    self.scheduler.miss('conditions_' + str(site.index))
+                continue
+
+            if 'dt' in jdata['current']:
+                self.scheduler.observe('conditions_' + str(site.index), jdata['current']['dt'], refresh)
+
+            try:
+                if conditions:
+                    with self.timings.span('conditions.update'):
+                        self.update_conditions(self.conditions_node(site), onecall.conditions(jdata), onecall.uv_index(jdata), force)
+                    if 'dt' in jdata['current']:
+                        self.timings.mark_good('conditions', int(jdata['current']['dt']))
+                if forecast:
+                    with self.timings.span('forecast.aggregate'):
+                        fcast = onecall.daily_forecast(jdata, self.precipitation_units)
+                    LOGGER.info('Created %d days forecast.', len(fcast))
+                    with self.timings.span('forecast.nodes'):
+                        self.update_forecast_nodes(site, fcast)
+                    self.timings.mark_good('forecast')
+            except Exception as e:
+                LOGGER.error('Failed to parse One Call data: ' + str(e))
+
+    def use_onecall(self):
+        return self.params.get('One Call API').lower() == 'true'
 
     def query(self):
         LOGGER.info("In Query...")
@@ -408,27 +782,64 @@ class Controller(polyinterface.Controller):
                 except:
                     LOGGER.debug('Failed to delete node ' + address)
 
-        for day in range(0,num_days):
-            address = 'forecast_' + str(day)
-            title = 'Forecast ' + str(day)
-            try:
-                node = owm_daily.DailyNode(self, self.address, address, title, self.params.get('Units'))
-                self.addNode(node)
-            except Exception as e:
-                LOGGER.error('Failed to create forecast node ' + title)
-                LOGGER.error(str(e))
+        # delete the nodes of locations that have been removed
+        wanted = set()
+        for site in self.sites:
+            wanted.add(site.conditions_address(self.address))
+            for day in range(0, num_days):
+                wanted.add(site.forecast_address(day))
+        for address in self.known_addresses():
+            if re.fullmatch(r'site_\d+|forecast_\d+_\d+', address) and address not in wanted:
+                try:
+                    self.delNode(address)
+                except:
+                    LOGGER.debug('Failed to delete node ' + address)
+
+        for site in self.sites:
+            if not site.is_primary():
+                address = site.conditions_address(self.address)
+                title = site.conditions_name()
+                try:
+                    node = owm_conditions.ConditionsNode(self, self.address, address, title, self.params.get('Units'))
+                    self.addNode(node)
+                except Exception as e:
+                    LOGGER.error('Failed to create conditions node ' + title)
+                    LOGGER.error(str(e))
+
+            for day in range(0,num_days):
+                address = site.forecast_address(day)
+                title = site.forecast_name(day)
+                try:
+                    node = owm_daily.DailyNode(self, self.address, address, title, self.params.get('Units'))
+                    self.addNode(node)
+                except Exception as e:
+                    LOGGER.error('Failed to create forecast node ' + title)
+                    LOGGER.error(str(e))
 
         # Set the uom dictionary based on current user units preference
         LOGGER.info('New Configure driver units to ' + self.params.get('Units'))
         self.uom = uom.get_uom(self.params.get('Units'))
         self.discovery = False
 
+    # Addresses of the nodes we've created this run plus the ones Polyglot
+    # already knows about.
+    def known_addresses(self):
+        addresses = set(self.nodes)
+        if 'nodes' in self.polyConfig:
+            for node in self.polyConfig['nodes']:
+                if 'address' in node:
+                    addresses.add(node['address'])
+        return addresses
+
     # Delete the node server from Polyglot
     def delete(self):
         LOGGER.info('Removing node server')
 
     def stop(self):
         LOGGER.info('Stopping node server')
+        if self.poll_timer is not None:
+            self.poll_timer.cancel()
+        self.http.close()
 
     def update_profile(self, command):
         st = self.poly.installprofile()
@@ -440,6 +851,11 @@ class Controller(polyinterface.Controller):
         if self.params.get_from_polyglot(self):
             LOGGER.debug('All required parameters are set!')
             self.configured = True
+            self.configure_http()
+            self.configure_cache()
+            self.configure_quota()
+            self.configure_trace()
+            self.build_sites()
             if int(self.params.get('Forecast Days')) > 5:
                 self.addNotice('Number of days of forecast data is limited to 5 days', 'forecast')
                 self.params.set('Forecast Days', 5)
@@ -469,6 +885,25 @@ class Controller(polyinterface.Controller):
         self.save_log_level(level)
         LOGGER.info('set_logging_level: Setting log level to %d' % level)
         LOGGER.setLevel(level)
+        self.trace.level_set()
+
+    # Profile the next poll cycles. The command has the number of cycles
+    # and what to profile (0 = CPU and memory, 1 = CPU, 2 = memory).
+    def profile_polls(self, command=None):
+        cycles = profiler.DEFAULT_CYCLES
+        mode = profiler.BOTH
+        query = command.get('query', {}) if command is not None else {}
+        try:
+            for (key, value) in query.items():
+                if key.startswith('Cycles'):
+                    cycles = int(float(value))
+                elif key.startswith('Mode'):
+                    mode = int(float(value))
+        except ValueError:
+            LOGGER.error('profile_polls: bad command ' + str(command))
+            return
+
+        self.profiler.arm(cycles, mode)
 
 
 
@@ -477,6 +912,7 @@ class Controller(polyinterface.Controller):
             'UPDATE_PROFILE': update_profile,
             'REMOVE_NOTICES_ALL': remove_notices_all,
             'DEBUG': set_logging_level,
+            'PROFILE': profile_polls,
             }
 
     # For this node server, all of the info is available in the single
@@ -501,5 +937,10 @@ class Controller(polyinterface.Controller):
             {'driver': 'GV14', 'value': 0, 'uom': 22},     # cloud conditions
             {'driver': 'DISTANC', 'value': 0, 'uom': 83},  # visibility
             {'driver': 'UV', 'value': 0, 'uom': 71},       # UV index
+            {'driver': 'GV15', 'value': 0, 'uom': 56},     # API calls left today
+            {'driver': 'GV16', 'value': 0, 'uom': 42},     # last API request time
+            {'driver': 'GV21', 'value': 0, 'uom': 42},     # last poll time
+            {'driver': 'GV22', 'value': 0, 'uom': 56},     # failed API requests
+            {'driver': 'GV23', 'value': 0, 'uom': 58},     # age of current conditions
             ]
 
@@ -0,0 +1,32 @@
+# Node definition for the current conditions of an additional location
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+
+from nodes import uom
+import node_funcs
+
+LOGGER = polyinterface.LOGGER
+
+@node_funcs.add_functions_as_methods(node_funcs.functions)
+class ConditionsNode(polyinterface.Node):
+    id = 'conditions'
+    def __init__(self, controller, primary, address, name, units):
+        self.uom = uom.get_uom(units)
+        self.units = units
+        self.drivers = []
+
+        # Same drivers as the controller node has for the first location
+        for driver in ['CLITEMP', 'CLIHUM', 'BARPRES', 'WINDDIR', 'GV0',
+                       'GV1', 'GV4', 'GV5', 'GV6', 'GV7', 'GV13', 'GV14',
+                       'DISTANC', 'UV']:
+            self.drivers.append({'driver': driver, 'value': 0, 'uom': self.uom[driver]})
+
+        # call the default init
+        super(ConditionsNode, self).__init__(controller, primary, address, name)
+
+    def set_driver_uom(self, units):
+        self.uom = uom.get_uom(units)
+        self.units = units
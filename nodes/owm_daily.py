@@ -6,9 +6,9 @@ except ImportError:
     import pgc_interface as polyinterface
 
 import json
-import time
-import datetime
+from nodes import aggregate
 from nodes import et3
+from nodes import timing
 from nodes import uom
 import node_funcs
 
@@ -36,6 +36,9 @@ class DailyNode(polyinterface.Node):
         self.drivers.append({'driver': 'UV', 'value': 0, 'uom': self.uom['UV']})
         self.drivers.append({'driver': 'GV20', 'value': 0, 'uom': self.uom['GV20']})
 
+        # inputs of the last update, see update_forecast
+        self.fingerprint = None
+
         # call the default init
         super(DailyNode, self).__init__(controller, primary, address, name)
 
@@ -57,50 +60,71 @@ class DailyNode(polyinterface.Node):
     def set_driver_uom(self, units):
         self.uom = uom.get_uom(units)
         self.units = units
+        self.fingerprint = None
 
     def mm2inch(self, mm):
         return mm/25.4
 
-    def update_forecast(self, forecast, latitude, elevation, plant_type, units):
+    # Everything the node's values are calculated from. When it's the same
+    # as last time there's nothing to update.
+    def forecast_fingerprint(self, forecast, latitude, elevation, plant_type, units):
+        return (forecast.values(), latitude, elevation, plant_type, units, self.units)
+
+    def update_forecast(self, forecast, latitude, elevation, plant_type, units, force=False):
+
+        fingerprint = self.forecast_fingerprint(forecast, latitude, elevation, plant_type, units)
+        if not force and fingerprint == self.fingerprint:
+            LOGGER.debug('Forecast for %s is unchanged', self.address)
+            return
+        self.fingerprint = fingerprint
 
-        LOGGER.info(forecast)
-        epoch = int(forecast['dt'])
-        dow = time.strftime("%w", time.localtime(epoch))
-        LOGGER.info('Day of week = ' + dow)
+        LOGGER.info('%s', forecast)
+        epoch = int(forecast.dt)
 
-        humidity = (forecast['Hmin'] + forecast['Hmax']) / 2
+        # The day of week and day of year come from the forecast's local
+        # day, fall back to the host's time if the record doesn't have
+        # them.
+        if forecast.dow is not None:
+            dow = forecast.dow
+            J = forecast.yday
+        else:
+            local_day = aggregate.day_id(epoch, aggregate.local_offset(epoch))
+            dow = aggregate.day_of_week(local_day)
+            J = aggregate.day_of_year(local_day)
+        LOGGER.info('Day of week = %d', dow)
+
+        humidity = (forecast.Hmin + forecast.Hmax) / 2
         self.update_driver('CLIHUM', round(humidity, 0))
-        self.update_driver('BARPRES', round(forecast['pressure'], 1))
-        self.update_driver('GV0', round(forecast['temp_max'], 1))
-        self.update_driver('GV1', round(forecast['temp_min'], 1))
-        self.update_driver('GV14', round(forecast['clouds'], 0))
-        self.update_driver('GV4', round(forecast['speed'], 1))
+        self.update_driver('BARPRES', round(forecast.pressure, 1))
+        self.update_driver('GV0', round(forecast.temp_max, 1))
+        self.update_driver('GV1', round(forecast.temp_min, 1))
+        self.update_driver('GV14', round(forecast.clouds, 0))
+        self.update_driver('GV4', round(forecast.speed, 1))
 
         self.update_driver('GV19', int(dow))
-        self.update_driver('GV13', forecast['weather'])
-        self.update_driver('UV', round(forecast['uv'], 1))
-        self.update_driver('GV6', round(forecast['rain'], 2))
-        self.update_driver('GV7', round(forecast['snow'], 2))
+        self.update_driver('GV13', forecast.weather)
+        self.update_driver('UV', round(forecast.uv, 1))
+        self.update_driver('GV6', round(forecast.rain, 2))
+        self.update_driver('GV7', round(forecast.snow, 2))
 
         # Calculate ETo
         #  Temp is in degree C and windspeed is in m/s, we may need to
         #  convert these.
-        J = datetime.datetime.fromtimestamp(epoch).timetuple().tm_yday
-
-        Tmin = forecast['temp_min']
-        Tmax = forecast['temp_max']
-        Ws = forecast['speed']
+        Tmin = forecast.temp_min
+        Tmax = forecast.temp_max
+        Ws = forecast.speed
         if units != 'si':
             LOGGER.info('Conversion of temperature/wind speed required')
             Tmin = et3.FtoC(Tmin)
             Tmax = et3.FtoC(Tmax)
             Ws = et3.mph2ms(Ws)
 
-        et0 = et3.evapotranspriation(Tmax, Tmin, None, Ws, float(elevation), forecast['Hmax'], forecast['Hmin'], latitude, float(plant_type), J)
+        with timing.get_timings().span('daily.et0'):
+            et0 = et3.evapotranspiration_cached(Tmax, Tmin, None, Ws, float(elevation), forecast.Hmax, forecast.Hmin, latitude, float(plant_type), J)
         if self.units == 'imperial':
             self.update_driver('GV20', round(self.mm2inch(et0), 3))
         else:
             self.update_driver('GV20', round(et0, 2))
-        LOGGER.info("ETo = %f %f" % (et0, self.mm2inch(et0)))
+        LOGGER.info("ETo = %f %f", et0, self.mm2inch(et0))
 
 
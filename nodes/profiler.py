@@ -0,0 +1,188 @@
+#
+#  On demand profiling
+#
+#  The PROFILE command arms cProfile and/or tracemalloc for the next N
+#  poll cycles. The CPU profile is collected over all of the cycles and the
+#  memory snapshot is taken at the end of the last one. The results are
+#  written to the log directory (profile-<time>.pstats and
+#  profile-<time>-memory.txt) and a summary is logged. Nothing is traced
+#  while the profiler isn't armed.
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import io
+import os
+import time
+import logging
+import threading
+import cProfile
+import pstats
+import tracemalloc
+
+LOGGER = polyinterface.LOGGER
+
+DEFAULT_CYCLES = 1
+MAX_CYCLES = 100
+
+# modes, matching the PROFMODE editor
+BOTH = 0
+CPU = 1
+MEMORY = 2
+
+# number of entries shown in the log summary and written to the memory
+# report
+SUMMARY_LINES = 15
+MEMORY_LINES = 50
+
+# frames kept per allocation
+TRACE_FRAMES = 5
+
+
+# The directory the node server's log file is in
+def log_directory():
+    logger = LOGGER
+    while logger is not None:
+        for handler in logger.handlers:
+            if isinstance(handler, logging.FileHandler):
+                return os.path.dirname(os.path.abspath(handler.baseFilename))
+        logger = logger.parent if logger.propagate else None
+    return os.path.abspath('logs')
+
+
+class ProfileCycle:
+    __slots__ = ('profiler', 'active')
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.active = False
+
+    def __enter__(self):
+        self.active = self.profiler.start_cycle()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.active:
+            self.profiler.end_cycle()
+        return False
+
+
+class PollProfiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cycles_left = 0
+        self.cycles = 0
+        self.mode = BOTH
+        self.profile = None
+        self.started_tracemalloc = False
+        self.running = False
+
+    def armed(self):
+        return self.cycles_left > 0
+
+    # cProfile only sees the thread it's enabled in, so while a cycle is
+    # being profiled its requests should be made on that thread.
+    def profiling_cpu(self):
+        return self.running and self.profile is not None
+
+    # Profile the next cycles poll cycles
+    def arm(self, cycles=DEFAULT_CYCLES, mode=BOTH):
+        cycles = max(1, min(int(cycles), MAX_CYCLES))
+        if mode not in (BOTH, CPU, MEMORY):
+            LOGGER.error('Unknown profiling mode %s' % str(mode))
+            return
+        with self.lock:
+            if self.cycles_left > 0:
+                LOGGER.warning('Profiling already armed, %d cycles left' % self.cycles_left)
+                return
+            self.cycles_left = cycles
+            self.cycles = cycles
+            self.mode = mode
+            self.profile = cProfile.Profile() if mode != MEMORY else None
+        LOGGER.warning('Profiling armed for the next %d poll cycles' % cycles)
+
+    # Wrap a poll cycle with this
+    def cycle(self):
+        return ProfileCycle(self)
+
+    def start_cycle(self):
+        with self.lock:
+            # Polls can overlap (the short poll timer), only profile one
+            if self.cycles_left == 0 or self.running:
+                return False
+            self.running = True
+            if self.mode != CPU and not tracemalloc.is_tracing():
+                tracemalloc.start(TRACE_FRAMES)
+                self.started_tracemalloc = True
+            if self.profile is not None:
+                self.profile.enable()
+        return True
+
+    def end_cycle(self):
+        with self.lock:
+            if self.profile is not None:
+                self.profile.disable()
+            self.running = False
+            self.cycles_left -= 1
+            if self.cycles_left > 0:
+                return
+            profile = self.profile
+            self.profile = None
+            snapshot = None
+            if self.mode != CPU and tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+                self.started_tracemalloc = False
+
+        try:
+            self.report(profile, snapshot)
+        except Exception as e:
+            LOGGER.error('Failed to write profile: ' + str(e))
+
+    def report(self, profile, snapshot):
+        directory = log_directory()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        base = os.path.join(directory, 'profile-' + time.strftime('%Y%m%d-%H%M%S'))
+
+        if profile is not None:
+            profile.dump_stats(base + '.pstats')
+            out = io.StringIO()
+            stats = pstats.Stats(profile, stream=out)
+            stats.sort_stats('cumulative').print_stats(SUMMARY_LINES)
+            LOGGER.warning('CPU profile of %d poll cycles written to %s.pstats\n%s' % (self.cycles, base, out.getvalue()))
+
+        if snapshot is None:
+            return
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ))
+        top = snapshot.statistics('lineno')
+        with open(base + '-memory.txt', 'w') as f:
+            f.write('Top %d allocations by line\n' % MEMORY_LINES)
+            for stat in top[:MEMORY_LINES]:
+                f.write(str(stat) + '\n')
+            f.write('\nTop allocations by traceback\n')
+            for stat in snapshot.statistics('traceback')[:10]:
+                f.write('%d blocks, %.1f KiB\n' % (stat.count, stat.size / 1024.0))
+                for line in stat.traceback.format():
+                    f.write(line + '\n')
+
+        total = sum([stat.size for stat in top])
+        lines = '\n'.join([str(stat) for stat in top[:SUMMARY_LINES]])
+        LOGGER.warning('Memory snapshot (%.1f KiB traced) written to %s-memory.txt\n%s' % (total / 1024.0, base, lines))
+
+
+# The profiler shared by every node in the process
+_profiler = None
+_profiler_lock = threading.Lock()
+
+def get_profiler():
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = PollProfiler()
+        return _profiler
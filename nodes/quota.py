@@ -0,0 +1,187 @@
+#
+#  API quota accounting
+#
+#  Free OpenWeatherMap keys are limited to a number of calls per minute
+#  and per day. Every request is checked against a token bucket for the
+#  per minute limit and a daily budget before it is sent. When calls are
+#  running short, the less important requests (UV forecast, UV, forecast)
+#  are dropped before the current conditions so the main data keeps
+#  updating. High priority requests wait a little for the bucket to
+#  refill instead of being dropped.
+#
+#  Retries of a request count as calls too, they're charged after the
+#  request. A 429 (too many requests) reply empties the bucket and stops
+#  requests for a while.
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import time
+import threading
+
+LOGGER = polyinterface.LOGGER
+
+# Free plan limits
+CALLS_PER_MINUTE = 60
+CALLS_PER_DAY = 1000
+
+# Priorities, lower number is more important
+HIGH = 0
+MEDIUM = 1
+LOW = 2
+LOWEST = 3
+
+# priority and cost (number of calls it counts as) of each endpoint
+ENDPOINTS = {
+        'weather': (HIGH, 1),
+        'group': (HIGH, 1),
+        'onecall': (HIGH, 1),
+        'forecast': (MEDIUM, 1),
+        'uvi': (LOW, 1),
+        'uvi/forecast': (LOWEST, 1),
+        }
+
+# Fraction of the budget that is kept for requests with a higher
+# priority. A LOW priority request is only made while more than 20% of
+# the calls are left.
+RESERVE = {
+        HIGH: 0.0,
+        MEDIUM: 0.1,
+        LOW: 0.2,
+        LOWEST: 0.3,
+        }
+
+# How long a high priority request waits for the bucket to refill
+MAX_WAIT = 5
+
+# Seconds without requests after the service says there were too many
+THROTTLE = 60
+
+
+class TokenBucket:
+    def __init__(self, capacity, per_second):
+        self.capacity = float(capacity)
+        self.per_second = float(per_second)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_second)
+        self.updated = now
+
+    # Seconds until count tokens are available
+    def wait_time(self, count):
+        self.refill()
+        if self.tokens >= count:
+            return 0
+        return (count - self.tokens) / self.per_second
+
+
+class KeyQuota:
+    def __init__(self, per_minute, per_day):
+        self.per_day = per_day
+        self.bucket = TokenBucket(per_minute, per_minute / 60.0)
+        self.day = self.today()
+        self.used_today = 0
+        self.dropped = 0
+        self.blocked_until = 0
+
+    # The service resets the daily count at midnight UTC
+    @staticmethod
+    def today():
+        return int(time.time() // 86400)
+
+    def remaining_today(self):
+        if self.today() != self.day:
+            self.day = self.today()
+            self.used_today = 0
+        return max(0, self.per_day - self.used_today)
+
+
+class QuotaManager:
+    def __init__(self, per_minute=CALLS_PER_MINUTE, per_day=CALLS_PER_DAY):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    # Change the limits, the calls already made today still count
+    def configure(self, per_minute, per_day):
+        per_minute = int(per_minute)
+        per_day = int(per_day)
+        with self.lock:
+            self.per_minute = per_minute
+            self.per_day = per_day
+            for q in self.keys.values():
+                q.per_day = per_day
+                q.bucket.capacity = float(per_minute)
+                q.bucket.per_second = per_minute / 60.0
+                q.bucket.tokens = min(q.bucket.tokens, q.bucket.capacity)
+
+    def _quota(self, key):
+        if key not in self.keys:
+            self.keys[key] = KeyQuota(self.per_minute, self.per_day)
+        return self.keys[key]
+
+    # Ask permission to make a request to endpoint using API key. Returns
+    # True if the call can be made and counts it, False if it should be
+    # skipped.
+    def acquire(self, key, endpoint):
+        (priority, cost) = ENDPOINTS.get(endpoint, (MEDIUM, 1))
+        reserve = RESERVE[priority]
+        deadline = time.monotonic() + (MAX_WAIT if priority == HIGH else 0)
+
+        while True:
+            with self.lock:
+                quota = self._quota(key)
+
+                if time.monotonic() < quota.blocked_until:
+                    quota.dropped += 1
+                    LOGGER.warning('API rate limited by the server, skipping ' + endpoint + ' request')
+                    return False
+
+                if quota.remaining_today() - cost < self.per_day * reserve:
+                    quota.dropped += 1
+                    LOGGER.warning('Daily API call budget low, skipping ' + endpoint + ' request')
+                    return False
+
+                # Keep part of the per minute bucket for the more important
+                # requests as well.
+                wait = quota.bucket.wait_time(cost + quota.bucket.capacity * reserve)
+                if wait == 0:
+                    quota.bucket.tokens -= cost
+                    quota.used_today += cost
+                    return True
+
+            if time.monotonic() + wait > deadline:
+                with self.lock:
+                    quota.dropped += 1
+                LOGGER.warning('API call rate limit reached, skipping ' + endpoint + ' request')
+                return False
+
+            time.sleep(wait)
+
+    # Count calls made without asking, the retries of a request
+    def charge(self, key, count):
+        with self.lock:
+            quota = self._quota(key)
+            quota.remaining_today()
+            quota.used_today += count
+            quota.bucket.refill()
+            quota.bucket.tokens -= count
+
+    # The service answered 429, stop for a while and start with an empty
+    # bucket
+    def throttle(self, key, seconds=THROTTLE):
+        with self.lock:
+            quota = self._quota(key)
+            quota.bucket.refill()
+            quota.bucket.tokens = min(quota.bucket.tokens, 0.0)
+            quota.blocked_until = time.monotonic() + seconds
+        LOGGER.warning('API rate limit exceeded, pausing requests for %d seconds' % seconds)
+
+    def remaining_today(self, key):
+        with self.lock:
+            return self._quota(key).remaining_today()
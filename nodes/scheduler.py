@@ -0,0 +1,131 @@
+#
+#  Adaptive poll scheduling
+#
+#  Every current conditions response has a 'dt' field with the time the
+#  data was calculated by OpenWeatherMap. By watching how that value
+#  changes we learn how often the data is refreshed and can skip polls
+#  that can't return anything new. The next query is then timed for just
+#  after the next expected refresh.
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import time
+import threading
+
+LOGGER = polyinterface.LOGGER
+
+# Used until we've seen the data change a few times
+DEFAULT_CADENCE = 600
+MIN_CADENCE = 60
+MAX_CADENCE = 3600
+
+# How long after the expected refresh to query
+MARGIN = 30
+
+# When a query finds the data hasn't been refreshed yet, try again after
+# this many seconds
+RETRY = 60
+
+# number of refresh intervals used to estimate the cadence
+HISTORY = 8
+
+
+class DataTimestamps:
+    __slots__ = ('last_dt', 'intervals', 'retry_at', 'misses')
+
+    def __init__(self):
+        self.last_dt = None
+        self.intervals = []
+        self.retry_at = 0
+        self.misses = 0
+
+
+class PollScheduler:
+    def __init__(self, default_cadence=DEFAULT_CADENCE, margin=MARGIN, retry=RETRY):
+        self.default_cadence = default_cadence
+        self.margin = margin
+        self.retry = retry
+        self.streams = {}
+        self.lock = threading.Lock()
+
+    # Record the data timestamp seen in a response. key identifies the
+    # data (endpoint and location). fresh is False when the data came from
+    # the cache, it can't tell us that the service hasn't refreshed.
+    def observe(self, key, dt, fresh=True, now=None):
+        if now is None:
+            now = time.time()
+        dt = int(dt)
+
+        with self.lock:
+            stream = self.streams.setdefault(key, DataTimestamps())
+            if stream.last_dt is None or dt > stream.last_dt:
+                if stream.last_dt is not None:
+                    stream.intervals.append(dt - stream.last_dt)
+                    del stream.intervals[:-HISTORY]
+                stream.last_dt = dt
+                stream.retry_at = 0
+                stream.misses = 0
+            elif fresh:
+                # We asked too early, the data hasn't been updated yet. Back
+                # off a bit more each time so a station that stops
+                # reporting doesn't get queried every poll.
+                stream.misses += 1
+                stream.retry_at = now + min(self.retry * stream.misses, MAX_CADENCE)
+
+    # Record a query for fresh data that returned nothing (request failed,
+    # no API calls left, ...). It backs off the same way as data that
+    # hasn't been refreshed.
+    def miss(self, key, now=None):
+        if now is None:
+            now = time.time()
+        with self.lock:
+            stream = self.streams.setdefault(key, DataTimestamps())
+            stream.misses += 1
+            stream.retry_at = now + min(self.retry * stream.misses, MAX_CADENCE)
+
+    # True once a data timestamp has been seen for key
+    def has_data(self, key):
+        with self.lock:
+            stream = self.streams.get(key)
+            return stream is not None and stream.last_dt is not None
+
+    # The refresh interval, the median of the intervals we've seen
+    def cadence(self, key):
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is None or len(stream.intervals) == 0:
+                return self.default_cadence
+            intervals = sorted(stream.intervals)
+        median = intervals[len(intervals) // 2]
+        return min(max(median, MIN_CADENCE), MAX_CADENCE)
+
+    # Time when new data should be available for key
+    def next_refresh(self, key):
+        cadence = self.cadence(key)
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is None:
+                return 0
+            if stream.last_dt is None:
+                return stream.retry_at
+            due = stream.last_dt + cadence + self.margin
+            return max(due, stream.retry_at)
+
+    def is_due(self, key, now=None):
+        if now is None:
+            now = time.time()
+        return now >= self.next_refresh(key)
+
+    # Seconds until the first of the keys is due
+    def seconds_until_due(self, keys, now=None):
+        if now is None:
+            now = time.time()
+        if len(keys) == 0:
+            return 0
+        return max(0, min([self.next_refresh(k) for k in keys]) - now)
+
+    def forget(self):
+        with self.lock:
+            self.streams = {}
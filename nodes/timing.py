@@ -0,0 +1,138 @@
+#
+#  Poll timing
+#
+#  Spans time the phases of a poll (HTTP, JSON decode, forecast
+#  aggregation, ET0, driver updates) with the monotonic clock. The last
+#  WINDOW durations of each phase are kept so percentiles can be shown
+#  and logged.
+#
+#    with timing.get_timings().span('forecast.aggregate'):
+#        ...
+
+import time
+import threading
+from collections import deque
+
+# number of durations kept per phase
+WINDOW = 100
+
+
+class RollingWindow:
+    __slots__ = ('values', 'last', 'count')
+
+    def __init__(self, size=WINDOW):
+        self.values = deque(maxlen=size)
+        self.last = 0.0
+        self.count = 0
+
+    def add(self, value):
+        self.values.append(value)
+        self.last = value
+        self.count += 1
+
+    def percentile(self, fraction):
+        if len(self.values) == 0:
+            return 0.0
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Span:
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timings.record(self.name, time.monotonic() - self.start)
+        return False
+
+
+class Timings:
+    def __init__(self, size=WINDOW):
+        self.size = size
+        self.phases = {}
+        self.errors = {}
+        self.good = {}
+        self.lock = threading.Lock()
+
+    def span(self, name):
+        return Span(self, name)
+
+    # Add a duration, in seconds
+    def record(self, name, seconds):
+        with self.lock:
+            window = self.phases.get(name)
+            if window is None:
+                window = RollingWindow(self.size)
+                self.phases[name] = window
+            window.add(seconds)
+
+    def last(self, name):
+        with self.lock:
+            window = self.phases.get(name)
+            return window.last if window is not None else 0.0
+
+    def percentile(self, name, fraction):
+        with self.lock:
+            window = self.phases.get(name)
+            return window.percentile(fraction) if window is not None else 0.0
+
+    def error(self, name):
+        with self.lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def error_count(self):
+        with self.lock:
+            return sum(self.errors.values())
+
+    # Note that good data was received for name. when is the time the
+    # data is from (the response's dt), data that came from the cache
+    # doesn't make it any younger.
+    def mark_good(self, name, when=None):
+        if when is None:
+            when = time.time()
+        with self.lock:
+            self.good[name] = max(when, self.good.get(name, when))
+
+    # Seconds since good data was last received for name, None if never
+    def age(self, name, now=None):
+        if now is None:
+            now = time.time()
+        with self.lock:
+            if name not in self.good:
+                return None
+            return now - self.good[name]
+
+    # {phase: {last, p50, p90, p99, count}} in milliseconds
+    def summary(self):
+        with self.lock:
+            phases = list(self.phases.items())
+        result = {}
+        for (name, window) in phases:
+            result[name] = {
+                    'last': window.last * 1000.0,
+                    'p50': window.percentile(0.50) * 1000.0,
+                    'p90': window.percentile(0.90) * 1000.0,
+                    'p99': window.percentile(0.99) * 1000.0,
+                    'count': window.count,
+                    }
+        return result
+
+
+# The timings shared by every node in the process
+_timings = None
+_timings_lock = threading.Lock()
+
+def get_timings():
+    global _timings
+    with _timings_lock:
+        if _timings is None:
+            _timings = Timings()
+        return _timings
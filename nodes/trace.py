@@ -0,0 +1,108 @@
+#
+#  Sampled trace logging
+#
+#  Logging on the poll path passes %-style arguments to the logger so
+#  nothing is formatted unless the record is written, and payload dumps
+#  are guarded with LOGGER.isEnabledFor(). At the default level a poll
+#  cycle costs little more than the level checks.
+#
+#  With Trace Cycles set to N, every Nth poll cycle is logged in full (at
+#  debug level) whatever the log level is, so the detail is there without
+#  running at debug all the time.
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import logging
+import threading
+
+LOGGER = polyinterface.LOGGER
+
+
+class TraceCycle:
+    __slots__ = ('sampler', 'active')
+
+    def __init__(self, sampler):
+        self.sampler = sampler
+        self.active = False
+
+    def __enter__(self):
+        self.active = self.sampler.start_cycle()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.active:
+            self.sampler.end_cycle()
+        return False
+
+
+class TraceSampler:
+    def __init__(self, every=0):
+        self.lock = threading.Lock()
+        self.every = every
+        self.count = 0
+        self.running = 0
+        self.saved_level = None
+        self.trace_level = None
+
+    # Log every Nth cycle in full, 0 turns sampling off
+    def configure(self, every):
+        every = int(every)
+        if every < 0:
+            raise ValueError('Trace Cycles can\'t be negative')
+        with self.lock:
+            self.every = every
+            self.count = 0
+
+    # Wrap a poll cycle with this
+    def cycle(self):
+        return TraceCycle(self)
+
+    def start_cycle(self):
+        with self.lock:
+            if self.every == 0:
+                return False
+            self.count += 1
+            if self.count % self.every != 0:
+                return False
+            # Cycles can overlap, the level is restored when the last
+            # one ends.
+            if self.running == 0:
+                self.saved_level = LOGGER.level
+                self.trace_level = None
+                if LOGGER.getEffectiveLevel() > logging.DEBUG:
+                    LOGGER.setLevel(logging.DEBUG)
+                    self.trace_level = LOGGER.level
+            self.running += 1
+        LOGGER.debug('Trace of poll cycle %d', self.count)
+        return True
+
+    def end_cycle(self):
+        with self.lock:
+            self.running -= 1
+            if self.running > 0:
+                return
+            # Only undo our change, a level set during the cycle stays
+            if self.trace_level is not None and LOGGER.level == self.trace_level:
+                LOGGER.setLevel(self.saved_level)
+            self.saved_level = None
+            self.trace_level = None
+
+    # The log level was set by the user (the DEBUG command), keep it when
+    # the traced cycle ends even if it's the level the trace uses
+    def level_set(self):
+        with self.lock:
+            self.trace_level = None
+
+
+# The sampler shared by every node in the process
+_sampler = None
+_sampler_lock = threading.Lock()
+
+def get_sampler():
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = TraceSampler()
+        return _sampler
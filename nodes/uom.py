@@ -39,6 +39,11 @@ def get_uom(units):
             'GV12': 25,     # climate intensity
             'GV13': 25,     # climate conditions
             'GV14': 22,     # cloud conditions
+            'GV15': 56,     # API calls left today
+            'GV16': 42,     # last API request time (ms)
+            'GV21': 42,     # last poll time (ms)
+            'GV22': 56,     # failed API requests
+            'GV23': 58,     # age of current conditions (s)
             'DISTANC': 38,  # visibility
             'UV': 71,       # UV index
             'GV17': 56,     # Air Quality
@@ -71,6 +76,11 @@ def get_uom(units):
             'GV12': 25,     # climate intensity
             'GV13': 25,     # climate conditions
             'GV14': 22,     # cloud conditions
+            'GV15': 56,     # API calls left today
+            'GV16': 42,     # last API request time (ms)
+            'GV21': 42,     # last poll time (ms)
+            'GV22': 56,     # failed API requests
+            'GV23': 58,     # age of current conditions (s)
             'DISTANC': 116, # visibility
             'UV': 71,       # UV index
             'GV17': 56,     # Air Quality
@@ -103,6 +113,11 @@ def get_uom(units):
             'GV12': 25,     # climate intensity
             'GV13': 25,     # climate conditions
             'GV14': 22,     # cloud conditions
+            'GV15': 56,     # API calls left today
+            'GV16': 42,     # last API request time (ms)
+            'GV21': 42,     # last poll time (ms)
+            'GV22': 56,     # failed API requests
+            'GV23': 58,     # age of current conditions (s)
             'DISTANC': 116, # visibility
             'UV': 71,       # UV index
             'GV17': 56,     # Air Quality
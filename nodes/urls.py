@@ -0,0 +1,97 @@
+#
+#  Request URL templates
+#
+#  Most of a request URL only depends on the configuration: the base URL,
+#  the endpoint, the units and the API key. That part is built once per
+#  endpoint and kept until the custom parameters change (the parameter
+#  store's generation number goes up). A request then only adds the
+#  location part of the query.
+#
+#  Query values are URL encoded so city names with spaces or other
+#  special characters work.
+
+import os
+from urllib.parse import quote
+from nodes import location
+from nodes import onecall
+
+# The OWM_BASE_URL and OWM_ONECALL_URL environment variables can point the
+# requests at another server, like the stand-in in bench/fake_owm.py
+BASE_URL = os.environ.get('OWM_BASE_URL', 'http://api.openweathermap.org/data/2.5/')
+
+# The One Call API is only available as version 3.0
+ONECALL_URL = os.environ.get('OWM_ONECALL_URL', 'http://api.openweathermap.org/data/3.0/')
+
+# Endpoints that return values in the configured units
+UNITS_ENDPOINTS = ('weather', 'forecast', 'group', 'onecall')
+
+# Extra query parameters for an endpoint
+EXTRA_QUERY = {
+        'onecall': (('exclude', onecall.EXCLUDE),),
+        }
+
+# characters left as is in query values
+SAFE = ','
+
+
+# Encode the values of a 'name=value&name=value' query string
+def encode_query(query):
+    parts = []
+    for part in query.split('&'):
+        (name, sep, value) = part.partition('=')
+        parts.append(quote(name, safe=SAFE) + sep + quote(value, safe=SAFE))
+    return '&'.join(parts)
+
+
+class RequestUrls:
+    def __init__(self, params, base_url=BASE_URL, onecall_url=ONECALL_URL):
+        self.params = params
+        self.base_url = base_url
+        self.onecall_url = onecall_url
+        self.generation = None
+        self.templates = {}
+        self.locations = {}
+
+    # Throw away the templates if the configuration changed
+    def check(self):
+        if self.generation != self.params.generation:
+            self.templates = {}
+            self.locations = {}
+            self.generation = self.params.generation
+
+    def set_base_url(self, base_url, onecall_url=None):
+        self.base_url = base_url
+        if onecall_url is not None:
+            self.onecall_url = onecall_url
+        self.generation = None
+
+    # (prefix, suffix) that go around the location part of the query
+    def template(self, endpoint):
+        self.check()
+        t = self.templates.get(endpoint)
+        if t is None:
+            suffix = ''
+            for (name, value) in EXTRA_QUERY.get(endpoint, ()):
+                suffix += '&' + name + '=' + quote(value, safe=SAFE)
+            if endpoint in UNITS_ENDPOINTS:
+                suffix += '&units=' + quote(self.params.get('Units'), safe=SAFE)
+            suffix += '&appid=' + quote(self.params.get('APIkey'), safe=SAFE)
+            base = self.onecall_url if endpoint == 'onecall' else self.base_url
+            t = (base + endpoint + '?', suffix)
+            self.templates[endpoint] = t
+        return t
+
+    # query is the location part, already encoded
+    def url(self, endpoint, query):
+        (prefix, suffix) = self.template(endpoint)
+        return prefix + query + suffix
+
+    # Encoded query for a Location parameter entry that hasn't been
+    # resolved yet
+    def location_query(self, loc):
+        self.check()
+        query = self.locations.get(loc)
+        if query is None:
+            query = encode_query(location.location_query(loc))
+            self.locations[loc] = query
+        return query
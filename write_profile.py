@@ -48,13 +48,22 @@ index_editor = {
         'GV13' : 'CONDITIONS',
         }
 
+# drivers that need an editor other than the default one for their uom
+driver_editor = {
+        'GV15' : 'CALLS',
+        'GV16' : 'MSEC',
+        'GV21' : 'MSEC',
+        'GV22' : 'ERRORS',
+        'GV23' : 'AGE',
+        }
+
 
 # Create a node definition file.
 # 
 # We're assuming that we're just creating the definition for the controller
 # node and that to do that, we just iterate through the driver list to
 # build the status section of the node definition.
-def write_profile(logger, drivers, daily_drivers):
+def write_profile(logger, drivers, daily_drivers, conditions_drivers=None):
     sd = get_server_data(logger)
     if sd is False:
         logger.error("Unable to complete without server data...")
@@ -75,7 +84,9 @@ def write_profile(logger, drivers, daily_drivers):
     nodedef.write("    <editors />\n")
     nodedef.write("    <sts>\n")
     for d in drivers:
-        if d['uom'] == 25:
+        if d['driver'] in driver_editor:
+            nodedef.write(STATUS_TMPL % (d['driver'], driver_editor[d['driver']]))
+        elif d['uom'] == 25:
             nodedef.write(STATUS_TMPL % (d['driver'], index_editor[d['driver']]))
         else:
             nodedef.write(STATUS_TMPL % (d['driver'], uom[d['uom']]))
@@ -90,6 +101,24 @@ def write_profile(logger, drivers, daily_drivers):
     nodedef.write("    </cmds>\n")
     nodedef.write("  </nodeDef>\n\n")
 
+    # Conditions node for additional locations
+    if conditions_drivers is not None:
+        nodedef.write(NODEDEF_TMPL % ('conditions', 'ctl'))
+        nodedef.write("    <editors />\n")
+        nodedef.write("    <sts>\n")
+        for d in conditions_drivers:
+            if d['uom'] == 25:
+                nodedef.write(STATUS_TMPL % (d['driver'], index_editor[d['driver']]))
+            else:
+                nodedef.write(STATUS_TMPL % (d['driver'], uom[d['uom']]))
+        nodedef.write("    </sts>\n")
+        nodedef.write("    <cmds>\n")
+        nodedef.write("      <sends />\n")
+        nodedef.write("      <accepts>\n")
+        nodedef.write("      </accepts>\n")
+        nodedef.write("    </cmds>\n")
+        nodedef.write("  </nodeDef>\n\n")
+
     # Daily Forecast Node
     nodedef.write(NODEDEF_TMPL % ('daily', 'ctl'))
     nodedef.write("    <editors />\n")